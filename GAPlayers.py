@@ -1,26 +1,84 @@
+import time
+
 import numpy as np
 from pyludo import LudoState, LudoStateFull
 from pyludo.utils import token_vulnerability
 
+from compact_board import MoveBuffer, relative_boards
+from instrumentation import timer
+
 
 class GABasePlayer:
     name = "base"
     gene_count = None
+    stackable = False
+    features_batch = None
 
     def __init__(self, chromosome):
+        self.moves = MoveBuffer()
+        self.set_chromosome(chromosome)
+
+    def set_chromosome(self, chromosome):
         self.chromosome = chromosome
 
     def play(self, state, dice_roll, next_states):
-        full_state = LudoStateFull(state, dice_roll, next_states)
-        action_values = self.eval_actions(full_state)
+        legal_ids = [token_id for token_id in range(4) if next_states[token_id] is not False]
+        if len(legal_ids) == 1:
+            return legal_ids[0]  # a forced move needs no evaluation
+        if timer.enabled:
+            start = time.perf_counter()
+            token_id = self.decide(state, dice_roll, next_states, legal_ids)
+            timer.add(self.name + ".decide", time.perf_counter() - start)
+            timer.decision_count += 1
+            return token_id
+        return self.decide(state, dice_roll, next_states, legal_ids)
+
+    def decide(self, state, dice_roll, next_states, legal_ids):
+        moves = self.moves.load(state, dice_roll, next_states)
+        return self.choose(self.eval_moves(moves), next_states)
+
+    @staticmethod
+    def choose(action_values, next_states):
         actions_prioritized = np.argsort(-action_values)
         for token_id in actions_prioritized:
             if next_states[token_id] is not False:
                 return token_id
 
+    def eval_moves(self, moves: MoveBuffer):
+        # scores for all four actions, only the unique legal candidates are evaluated
+        return moves.spread(self.eval_unique(moves))
+
+    def eval_unique(self, moves: MoveBuffer):
+        pass
+
     def eval_actions(self, full_state: LudoStateFull):
+        return self.eval_moves(MoveBuffer().load(full_state.state, full_state.dice_roll, full_state.next_states))
+
+    @classmethod
+    def stack_weights(cls, chromosomes: np.ndarray):
+        pass
+
+    @classmethod
+    def score_stacked(cls, features: np.ndarray, weights):
+        # features of shape (chromosome count, 4, feature count), one chromosome per row of the weights
         pass
 
+    @classmethod
+    def eval_stacked(cls, weights, moves_list):
+        """
+        Scores one decision for each of the stacked chromosomes in a single batched operation.
+        moves_list holds the MoveBuffer of every chromosome, or None for chromosomes not to move.
+        """
+        unique_features = [None if moves is None else cls.features(moves) for moves in moves_list]
+        feature_count = next(f.shape[1] for f in unique_features if f is not None)
+        features = np.zeros((len(moves_list), 4, feature_count))
+        for i, f in enumerate(unique_features):
+            if f is not None:
+                features[i, :len(f)] = f
+        unique_scores = cls.score_stacked(features, weights)
+        return [None if moves is None else moves.spread(unique_scores[i, :len(moves.unique_ids)])
+                for i, moves in enumerate(moves_list)]
+
     @staticmethod
     def normalize(chromosome):
         return chromosome
@@ -35,40 +93,75 @@ class GASimplePlayer(GABasePlayer):
     name = "simple"
     args = []
     gene_count = 4
+    stackable = True
 
     def __init__(self, chromosome):
         super(GASimplePlayer, self).__init__(chromosome)
 
+    def set_chromosome(self, chromosome):
+        self.chromosome = chromosome
+        self.genes = [float(gene) for gene in chromosome[:self.gene_count]]
+
     @staticmethod
-    def count_home_tokens(opponents):
-        home = 0
-        for opponent in opponents:
-            for token in opponent:
-                if token == -1:
-                    home += 1
-        return home
-
-    def eval_action(self, state, next_state, token_id):
-        if next_state == False:
-            return 0
-
-        cur_token_pos = state[0][token_id]
-        next_token_pos = next_state[0][token_id]
-        cur_opponents = state[1:]
-        next_opponents = next_state[1:]
-
-        moved_out = next_token_pos > -1 == cur_token_pos
-        enter_goal = next_token_pos == 99 > cur_token_pos
-        enter_safe_zone = next_token_pos > 51 >= cur_token_pos
-        opps_hit_home = self.count_home_tokens(next_opponents) - self.count_home_tokens(cur_opponents)
-        reduced_state = [moved_out, enter_goal, enter_safe_zone, opps_hit_home]
-        return sum([gene * val for gene, val in zip(self.chromosome, reduced_state)])
+    def rows(state):
+        # the rows of a LudoState, numpy or list state as python lists
+        rows = [state[player_id] for player_id in range(4)]
+        return [row.tolist() if isinstance(row, np.ndarray) else list(row) for row in rows]
 
-    def eval_actions(self, full_state: LudoStateFull):
-        action_scores = np.empty(4)
-        for i in range(4):
-            action_scores[i] = self.eval_action(full_state.state, full_state.next_states[i], i)
-        return action_scores
+    @staticmethod
+    def opponents_home(rows):
+        return rows[1].count(-1) + rows[2].count(-1) + rows[3].count(-1)
+
+    def decide(self, state, dice_roll, next_states, legal_ids):
+        # four features of a single decision are cheaper in plain python than as numpy arrays
+        state = self.rows(state)
+        moved_out_gene, enter_goal_gene, enter_safe_zone_gene, opps_hit_home_gene = self.genes
+        opponents_home = self.opponents_home(state)
+        best_id, best_score = None, None
+        for token_id in legal_ids:
+            next_state = self.rows(next_states[token_id])
+            cur_token_pos = state[0][token_id]
+            next_token_pos = next_state[0][token_id]
+            score = (moved_out_gene * (next_token_pos > -1 == cur_token_pos)
+                     + enter_goal_gene * (next_token_pos == 99 > cur_token_pos)
+                     + enter_safe_zone_gene * (next_token_pos > 51 >= cur_token_pos)
+                     + opps_hit_home_gene * (self.opponents_home(next_state) - opponents_home))
+            if best_score is None or score > best_score:
+                best_id, best_score = token_id, score
+        return best_id
+
+    @staticmethod
+    def features_batch(boards, candidates, action_ids):
+        # boards (B, 4, 4), candidates (B, K, 4, 4) and the action ids (B, K) of the candidates
+        batch_ids = np.arange(len(boards))[:, None]
+        cur_token_pos = boards[batch_ids, 0, action_ids]
+        next_token_pos = candidates[batch_ids, np.arange(candidates.shape[1])[None, :], 0, action_ids]
+        features = np.empty(candidates.shape[:2] + (4,))
+        features[..., 0] = (next_token_pos > -1) & (cur_token_pos == -1)  # moved out
+        features[..., 1] = (next_token_pos == 99) & (cur_token_pos < 99)  # enter goal
+        features[..., 2] = (next_token_pos > 51) & (cur_token_pos <= 51)  # enter safe zone
+        features[..., 3] = ((candidates[:, :, 1:] == -1).sum(axis=(2, 3))
+                            - (boards[:, None, 1:] == -1).sum(axis=(2, 3)))  # opponents hit home
+        return features
+
+    @classmethod
+    def features(cls, moves: MoveBuffer):
+        action_ids = np.array(moves.unique_ids, np.intp)
+        return cls.features_batch(moves.board[None], moves.candidates[None, action_ids], action_ids[None])[0]
+
+    def score_features(self, features):
+        return features @ self.chromosome[:self.gene_count]
+
+    def eval_unique(self, moves: MoveBuffer):
+        return self.score_features(self.features(moves))
+
+    @classmethod
+    def stack_weights(cls, chromosomes):
+        return chromosomes[:, :cls.gene_count]
+
+    @classmethod
+    def score_stacked(cls, features, weights):
+        return np.einsum('naf,nf->na', features, weights)
 
     @staticmethod
     def normalize(chromosome):
@@ -86,38 +179,29 @@ class GAAdvancedPlayer(GABasePlayer):
         super(GAAdvancedPlayer, self).__init__(chromosome)
 
     @staticmethod
-    def token_progress_potential(token, params):
-        if token == -1:
-            return 0
-        if token < 52:
-            return params[0] + token / 51 * params[1]
-        if token < 99:
-            return params[0] + params[1] + params[2]
-        return params[0] + params[1] + params[2] + params[3]
+    def token_progress_potential(tokens, params):
+        return np.where(tokens == -1, 0, np.where(
+            tokens < 52, params[0] + tokens / 51 * params[1], np.where(
+                tokens < 99, params[0] + params[1] + params[2], params[0] + params[1] + params[2] + params[3])))
 
-    def eval_actions(self, full_state: LudoStateFull):
-        action_scores = np.zeros(4)
-        for action_id, state in enumerate(full_state.next_states):
-            if state == False:
-                action_scores[action_id] = -1e9
-                continue
-
-            token_potentials = np.empty((4, 4))
+    def eval_unique(self, moves: MoveBuffer):
+        action_scores = np.empty(len(moves.unique_ids))
+        for i, action_id in enumerate(moves.unique_ids):
+            boards = relative_boards(moves.candidates[action_id])
+            token_prog = self.token_progress_potential(boards[:, 0], self.chromosome[:4])
+            token_vuln = np.empty((4, 4))
             for player_id in range(4):
-                relative_state = LudoState.get_state_relative_to_player(state, player_id)
+                relative_state = LudoState(boards[player_id])
                 for token_id in range(4):
-                    token = relative_state[0][token_id]
-                    token_prog = self.token_progress_potential(token, self.chromosome[:4])
-                    token_vuln = token_vulnerability(relative_state, token_id)
-                    approx_stay_probability = (5 / 6) ** token_vuln
-                    token_pot = token_prog * approx_stay_probability
-                    token_potentials[player_id, token_id] = token_pot
+                    token_vuln[player_id, token_id] = token_vulnerability(relative_state, token_id)
+            approx_stay_probability = (5 / 6) ** token_vuln
+            token_potentials = token_prog * approx_stay_probability
 
             player_potentials = token_potentials.mean(axis=1)
             player_potential = player_potentials[0]
             opponents_rank = np.argsort(-player_potentials[1:]) + 1
             opponent_potentials = player_potentials[opponents_rank]
-            action_scores[action_id] = player_potential - np.sum(opponent_potentials * self.chromosome[4:7])
+            action_scores[i] = player_potential - np.sum(opponent_potentials * self.chromosome[4:7])
         return action_scores
 
 
@@ -127,35 +211,136 @@ class GAFullPlayer(GABasePlayer):
     inp_size = 4 * 59 + 1
     hidden_size = 100
     gene_count = (4 * 59 + 1) * 100 + 100
+    stackable = True
+    row_groups = np.arange(4)  # the input rows of the four players
 
     def __init__(self, chromosome):
         super(GAFullPlayer, self).__init__(chromosome)
+
+    def set_chromosome(self, chromosome):
+        self.chromosome = chromosome
         w0_len = self.inp_size * self.hidden_size
         w1_len = self.hidden_size
         self.w0 = chromosome[:w0_len].reshape(self.inp_size, self.hidden_size)
         self.w1 = chromosome[w0_len:w0_len + w1_len].reshape(self.hidden_size)
 
-    def eval_actions(self, full_state: LudoStateFull):
-        action_scores = np.zeros(4)
-        for action_id, state in enumerate(full_state.next_states):
-            if state == False:
-                action_scores[action_id] = -1e9
-                continue
-            flat_state_rep = np.zeros(self.inp_size)
-            flat_state_rep[-1] = 1  # bias
-            full_state_rep = flat_state_rep[:self.inp_size - 1].reshape((4, 59))
-            for player_id in range(4):
-                for token in state[player_id]:
-                    full_state_rep[player_id][min(token + 1, 58)] += 1
-            hidden = np.tanh((flat_state_rep @ self.w0) * np.sqrt(1 / self.inp_size))
-            out = hidden @ self.w1
-            action_scores[action_id] = out
-        return action_scores
+    @classmethod
+    def features_batch(cls, boards, candidates, action_ids):
+        # token counts per row group and position bin of every candidate, plus a bias input
+        b, k = candidates.shape[:2]
+        group_count = cls.row_groups[-1] + 1
+        token_bins = np.clip(candidates.astype(np.intp) + 1, 0, 58)
+        rows = (np.arange(b * k).reshape((b, k, 1, 1)) * group_count + cls.row_groups.reshape((4, 1))) * 59
+        counts = np.bincount((rows + token_bins).ravel(), minlength=b * k * group_count * 59)
+        counts = counts.reshape((b, k, group_count * 59))
+        features = np.ones((b, k, cls.inp_size))
+        features[..., :cls.inp_size - 1] = counts
+        return features
+
+    @classmethod
+    def features(cls, moves: MoveBuffer):
+        action_ids = np.array(moves.unique_ids, np.intp)
+        return cls.features_batch(moves.board[None], moves.candidates[None, action_ids], action_ids[None])[0]
+
+    def score_features(self, features):
+        hidden = np.tanh((features @ self.w0) * np.sqrt(1 / self.inp_size))
+        return hidden @ self.w1
+
+    def eval_unique(self, moves: MoveBuffer):
+        return self.score_features(self.features(moves))
+
+    @classmethod
+    def input_ids(cls, candidates):
+        # the input weight row of every token of the candidates (K, 4, 4), shape (K, 16)
+        token_bins = np.clip(candidates + 1, 0, 58)
+        return (cls.row_groups[:, None] * 59 + token_bins).reshape((len(candidates), 16))
+
+    def score_input_ids(self, input_ids):
+        # the one-hot input times w0 is the sum of the input weight rows of the tokens, plus the bias row
+        hidden = np.tanh((self.w0[input_ids].sum(axis=1) + self.w0[-1]) * np.sqrt(1 / self.inp_size))
+        return hidden @ self.w1
+
+    def decide(self, state, dice_roll, next_states, legal_ids):
+        candidates = np.array([[next_states[token_id][player_id] for player_id in range(4)] for token_id in legal_ids],
+                              np.intp)
+        return legal_ids[int(np.argmax(self.score_input_ids(self.input_ids(candidates))))]
+
+    @classmethod
+    def stack_weights(cls, chromosomes):
+        w0_len = cls.inp_size * cls.hidden_size
+        w0 = chromosomes[:, :w0_len].reshape((-1, cls.inp_size, cls.hidden_size))
+        w1 = chromosomes[:, w0_len:w0_len + cls.hidden_size]
+        return w0, w1
+
+    @classmethod
+    def score_stacked(cls, features, weights):
+        w0, w1 = weights
+        hidden = np.tanh(np.matmul(features, w0) * np.sqrt(1 / cls.inp_size))
+        return np.einsum('nah,nh->na', hidden, w1)
+
+
+class GASharedPlayer(GAFullPlayer):
+    """
+    The full player with one set of input weights shared by the three opponents, which are summed into one input row.
+    The encoding of the board is the same, at half the genes.
+    """
+    name = "shared"
+    args = []
+    inp_size = 2 * 59 + 1
+    hidden_size = 100
+    gene_count = (2 * 59 + 1) * 100 + 100
+    row_groups = np.array([0, 1, 1, 1])
+
+    def __init__(self, chromosome):
+        super(GASharedPlayer, self).__init__(chromosome)
+
+
+class GASharedLowRankPlayer(GASharedPlayer):
+    """The shared player with the input weights factorized as (inp_size, rank) @ (rank, hidden_size)."""
+    name = "shared_lowrank"
+    args = []
+    rank = 10
+    gene_count = (2 * 59 + 1) * 10 + 10 * 100 + 100
+
+    def __init__(self, chromosome):
+        super(GASharedLowRankPlayer, self).__init__(chromosome)
+
+    def set_chromosome(self, chromosome):
+        self.chromosome = chromosome
+        u_len = self.inp_size * self.rank
+        v_len = self.rank * self.hidden_size
+        self.u = chromosome[:u_len].reshape(self.inp_size, self.rank)
+        self.v = chromosome[u_len:u_len + v_len].reshape(self.rank, self.hidden_size)
+        self.w1 = chromosome[u_len + v_len:u_len + v_len + self.hidden_size]
+
+    def score_features(self, features):
+        hidden = np.tanh(((features @ self.u) @ self.v) * np.sqrt(1 / (self.inp_size * self.rank)))
+        return hidden @ self.w1
+
+    def score_input_ids(self, input_ids):
+        hidden = np.tanh(((self.u[input_ids].sum(axis=1) + self.u[-1]) @ self.v)
+                         * np.sqrt(1 / (self.inp_size * self.rank)))
+        return hidden @ self.w1
+
+    @classmethod
+    def stack_weights(cls, chromosomes):
+        u_len = cls.inp_size * cls.rank
+        v_len = cls.rank * cls.hidden_size
+        u = chromosomes[:, :u_len].reshape((-1, cls.inp_size, cls.rank))
+        v = chromosomes[:, u_len:u_len + v_len].reshape((-1, cls.rank, cls.hidden_size))
+        w1 = chromosomes[:, u_len + v_len:u_len + v_len + cls.hidden_size]
+        return u, v, w1
+
+    @classmethod
+    def score_stacked(cls, features, weights):
+        u, v, w1 = weights
+        hidden = np.tanh(np.matmul(np.matmul(features, u), v) * np.sqrt(1 / (cls.inp_size * cls.rank)))
+        return np.einsum('nah,nh->na', hidden, w1)
+
+
+ga_players = [GASimplePlayer, GAAdvancedPlayer, GAFullPlayer, GASharedPlayer, GASharedLowRankPlayer]
+ga_player_map = {player.name: player for player in ga_players}
 
 
 def get_ga_player(name):
-    players = [GASimplePlayer, GAAdvancedPlayer, GAFullPlayer]
-    player_map = {}
-    for player in players:
-        player_map[player.name] = player
-    return player_map[name]
+    return ga_player_map[name]
@@ -76,9 +76,9 @@ class RealAdaptiveNStepNormalMutator(BaseMutator):
         return np.concatenate((genes_, sigma_))
 
 
+mutators = [NoneMutator, RealNormalMutator, RealAdaptiveOneStepNormalMutator, RealAdaptiveNStepNormalMutator]
+mutator_map = {mutator.name: mutator for mutator in mutators}
+
+
 def get_mutator(name):
-    mutators = [NoneMutator, RealNormalMutator, RealAdaptiveOneStepNormalMutator, RealAdaptiveNStepNormalMutator]
-    mutator_map = {}
-    for mutator in mutators:
-        mutator_map[mutator.name] = mutator
     return mutator_map[name]
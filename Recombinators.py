@@ -68,9 +68,9 @@ class RealBlendRecombinator(BaseRecombinator):
         return child_1, child_2
 
 
+recombinators = [NoneRecombinator, RealUniformRecombinator, RealWholeArithmeticRecombinator, RealBlendRecombinator]
+recombinator_map = {recombinator.name: recombinator for recombinator in recombinators}
+
+
 def get_recombinator(name):
-    recombinators = [NoneRecombinator, RealUniformRecombinator, RealWholeArithmeticRecombinator, RealBlendRecombinator]
-    recombinator_map = {}
-    for recombinator in recombinators:
-        recombinator_map[recombinator.name] = recombinator
     return recombinator_map[name]
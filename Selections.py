@@ -1,10 +1,10 @@
 import math
-import random
 
 import numpy as np
 from progressbar import ProgressBar, Percentage
 
-from pyludo import LudoGame
+from game_jobs import GameJob, LocalRunner
+from instrumentation import timer, memory
 
 
 class BaseTournamentSelection:
@@ -15,6 +15,13 @@ class BaseTournamentSelection:
     cur_tournament_count = None
     current_generation = 0
     total_game_count = 0
+    runner = LocalRunner
+    race_mode = None
+    record_dir = None
+    fitness_inheritance = False
+    fitness_history_cap = 0
+    fitness_history = None
+    surrogate = None
 
     def __init__(self, Player, population_size, pop_init, recombine, mutate):
         self.Player = Player
@@ -30,34 +37,97 @@ class BaseTournamentSelection:
     def get_flat_pop(self):
         return self.population.reshape((-1, self.population.shape[-1]))
 
+    def load_population(self, flat_pop):
+        self.population = flat_pop.reshape(self.population.shape)
+
+    def get_state(self):
+        """Arrays, besides the population, that a continued run needs. None if there are none."""
+        return None
+
+    def set_state(self, state):
+        pass
+
     def play_tournament(self, chromosome_ids, game_count):
+        self.play_tournaments([chromosome_ids], game_count)
+
+    def play_tournaments(self, tournaments, game_count):
+        # tournaments within one call must not share chromosomes, so their games can be played in any order
+        flat_pop = self.get_flat_pop()
+        with memory.subsystem("tournament.jobs"):
+            jobs = [GameJob(self.Player.name, flat_pop[chromosome_ids], game_count, race_mode=self.race_mode,
+                            record_dir=self.record_dir) for chromosome_ids in tournaments]
+        all_win_counts = iter(self.runner.run(jobs))
+        for chromosome_ids in tournaments:
+            with timer.phase("tournament.games"), memory.subsystem("tournament.games"):
+                win_counts = next(all_win_counts)
+            with memory.subsystem("tournament.finish"):
+                self.finish_tournament(chromosome_ids, win_counts, game_count)
+
+    def finish_tournament(self, chromosome_ids, win_counts, game_count):
         flat_pop = self.get_flat_pop()
-        chromosomes = flat_pop[chromosome_ids]
-        players = [self.Player(chromosome) for chromosome in chromosomes]
-        tournament_player_ids = {}
-        for i, player in enumerate(players):
-            tournament_player_ids[player] = i
-        win_rates = np.zeros(4)
-        for _ in range(game_count):
-            random.shuffle(players)
-            game = LudoGame(players)
-            winner = players[game.play_full_game()]
-            win_rates[tournament_player_ids[winner]] += 1
-        ranked_chromosome_ids = chromosome_ids[np.argsort(-win_rates)]
-        children = self.recombine(*flat_pop[ranked_chromosome_ids[:2]])
-        children = [self.mutate(child) for child in children]
-        children = [self.Player.normalize(child) for child in children]
-        flat_pop[ranked_chromosome_ids[2:]] = children
+        if self.fitness_inheritance:
+            ranked_chromosome_ids = self.rank_with_history(chromosome_ids, win_counts, game_count)
+        else:
+            ranked_chromosome_ids = chromosome_ids[np.argsort(-win_counts)]
+        if self.surrogate is not None:
+            with timer.phase("tournament.surrogate"):
+                fitness = win_counts / game_count
+                self.surrogate.update(flat_pop[chromosome_ids], fitness - fitness.mean())
+        flat_pop[ranked_chromosome_ids[2:]] = self.make_children(flat_pop[ranked_chromosome_ids[:2]])
 
         self.total_game_count += game_count
+        timer.game_count += game_count
         self.cur_tournament_count += 1
-        self.progress_bar.update(self.cur_tournament_count)
+        with memory.subsystem("progress_bar"):
+            self.progress_bar.update(self.cur_tournament_count)
+
+    def make_children(self, parents):
+        candidate_count = 1
+        if self.surrogate is not None and self.surrogate.is_ready():
+            candidate_count = self.surrogate.candidate_count
+        candidates = []
+        for _ in range(candidate_count):
+            with timer.phase("tournament.recombine"):
+                children = self.recombine(*parents)
+            with timer.phase("tournament.mutate"):
+                children = [self.mutate(child) for child in children]
+            with timer.phase("tournament.normalize"):
+                children = [self.Player.normalize(child) for child in children]
+            candidates += children
+        if len(candidates) == 2:
+            return candidates
+        # only the most promising children according to the surrogate get to play
+        with timer.phase("tournament.surrogate"):
+            predicted_fitness = self.surrogate.predict(np.array(candidates))
+        return [candidates[i] for i in np.argsort(-predicted_fitness)[:2]]
+
+    def rank_with_history(self, chromosome_ids, win_counts, game_count):
+        # accumulated [games, wins] of every chromosome since it was created, used as a prior for the fresh games
+        if self.fitness_history is None:
+            self.fitness_history = np.zeros((len(self.get_flat_pop()), 2))
+        history = self.fitness_history[chromosome_ids]
+        history[:, 0] += game_count
+        history[:, 1] += win_counts
+        ranked = np.argsort(-history[:, 1] / history[:, 0])
+        if self.fitness_history_cap and history[:, 0].max() > self.fitness_history_cap:
+            history *= np.minimum(1, self.fitness_history_cap / history[:, 0])[:, None]
+        self.fitness_history[chromosome_ids] = history
+        # the two replaced chromosomes start over
+        self.fitness_history[chromosome_ids[ranked[2:]]] = 0
+        return chromosome_ids[ranked]
+
+    def move_chromosomes(self, old_ids, new_ids):
+        flat_pop = self.get_flat_pop()
+        flat_pop[new_ids] = flat_pop[old_ids]
+        if self.fitness_history is not None:
+            self.fitness_history[new_ids] = self.fitness_history[old_ids]
 
     def step(self, generation_count=1):
         total_tournament_count = generation_count * self.tournaments_per_generation
         self.cur_tournament_count = 0
         text = "Generation {}, playing {} tournaments now...".format(self.current_generation, total_tournament_count)
-        self.progress_bar = ProgressBar(widgets=[text, Percentage()], maxval=total_tournament_count).start()
+        with memory.subsystem("progress_bar"):
+            self.progress_bar = ProgressBar(widgets=[text, Percentage()], maxval=total_tournament_count).start()
         for _ in range(generation_count):
             self.next_generation()
             self.current_generation += 1
@@ -78,9 +148,9 @@ class TournamentSelection(BaseTournamentSelection):
 
     def next_generation(self):
         np.random.shuffle(self.all_chromosome_ids)
-        for tournament_id in range(self.population_size // 4):
-            chromosome_ids = self.all_chromosome_ids[tournament_id * 4:tournament_id * 4 + 4]
-            self.play_tournament(chromosome_ids, self.games_per_tournament)
+        tournaments = [self.all_chromosome_ids[tournament_id * 4:tournament_id * 4 + 4]
+                       for tournament_id in range(self.population_size // 4)]
+        self.play_tournaments(tournaments, self.games_per_tournament)
 
 
 class CellularTournamentSelection(BaseTournamentSelection):
@@ -98,13 +168,14 @@ class CellularTournamentSelection(BaseTournamentSelection):
 
     def next_generation(self, generation_count=1):
         off_x, off_y = [(0, 0), (0, 1), (1, 1), (1, 0)][self.current_generation % 4]
+        tournaments = []
         for x in range(0, self.grid_size, 2):
             for y in range(0, self.grid_size, 2):
-                chromosome_ids = np.array([
+                tournaments.append(np.array([
                     ((y + dy + off_y) % self.grid_size) * self.grid_size + (x + dx + off_x) % self.grid_size
                     for dx, dy in ((0, 0), (0, 1), (1, 1), (1, 0))
-                ])
-                self.play_tournament(chromosome_ids, self.games_per_tournament)
+                ]))
+        self.play_tournaments(tournaments, self.games_per_tournament)
 
 
 class IslandTournamentSelection(BaseTournamentSelection):
@@ -128,12 +199,13 @@ class IslandTournamentSelection(BaseTournamentSelection):
         self.all_island_chromosome_ids = np.arange(chromosomes_per_island)
 
     def next_generation(self):
+        tournaments = []
         for island_id in range(self.island_count):
             np.random.shuffle(self.all_island_chromosome_ids)
             for tournament_id in range(self.chromosomes_per_island // 4):
                 chromosome_ids = self.all_island_chromosome_ids[tournament_id * 4:tournament_id * 4 + 4]
-                chromosome_ids = chromosome_ids + island_id * self.chromosomes_per_island
-                self.play_tournament(chromosome_ids, self.games_per_tournament)
+                tournaments.append(chromosome_ids + island_id * self.chromosomes_per_island)
+        self.play_tournaments(tournaments, self.games_per_tournament)
         if self.current_generation % self.generations_per_epoch == 0:
             self.migrate()
 
@@ -146,12 +218,146 @@ class IslandTournamentSelection(BaseTournamentSelection):
         old_migrant_ids = migrant_ids.reshape(-1)
         new_migrant_ids = old_migrant_ids.copy()
         np.random.shuffle(new_migrant_ids)
-        self.get_flat_pop()[new_migrant_ids] = self.get_flat_pop()[old_migrant_ids]
+        self.move_chromosomes(old_migrant_ids, new_migrant_ids)
+
+
+class CMAESSelection(BaseTournamentSelection):
+    """
+    (mu/mu_w, lambda)-CMA-ES. Every generation, population_size candidates are sampled from the search distribution
+    and all of them are played in one batch against the opponent pool (comma separated opponent names).
+    The recombinator and mutator are not used. The sigma columns of the saved population hold the step size.
+    Above max_full_gene_count genes only the diagonal of the covariance is adapted (sep-CMA-ES).
+    """
+    name = "cma_es"
+    args = [("population_size", int), ("games_per_candidate", int), ("opponents", str)]
+    max_full_gene_count = 200
+
+    def __init__(self, Player, pop_init, recombine, mutate, population_size, games_per_candidate, opponents):
+        super(CMAESSelection, self).__init__(Player, population_size, pop_init, recombine, mutate)
+        self.tournaments_per_generation = population_size
+        self.games_per_candidate = games_per_candidate
+        self.opponent_names = opponents.split(",")
+        n = self.gene_count = Player.gene_count
+        self.separable = n > self.max_full_gene_count
+
+        lam = population_size
+        mu = lam // 2
+        weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = weights / weights.sum()
+        self.mu = mu
+        self.mueff = mueff = 1 / np.sum(self.weights ** 2)
+        self.cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+        self.cs = (mueff + 2) / (n + mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + mueff)
+        self.cmu = min(1 - self.c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+        if self.separable:
+            self.c1 = min(1, self.c1 * (n + 2) / 3)
+            self.cmu = min(1 - self.c1, self.cmu * (n + 2) / 3)
+        self.damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+        self.reset_distribution()
+
+    def reset_distribution(self):
+        flat_pop = self.get_flat_pop()
+        n = self.gene_count
+        self.mean = flat_pop[:, :n].mean(axis=0)
+        self.sigma = flat_pop[:, n:].mean() if flat_pop.shape[1] > n else 0.3
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.eigen_generation = 0
+        # C = B diag(D^2) B^T, with only D kept in the separable case
+        self.B = None if self.separable else np.eye(n)
+        self.D = np.ones(n)
+        self.C = np.ones(n) if self.separable else np.eye(n)
+
+    def load_population(self, flat_pop):
+        super(CMAESSelection, self).load_population(flat_pop)
+        self.reset_distribution()
+
+    def get_state(self):
+        state = {"mean": self.mean, "sigma": self.sigma, "pc": self.pc, "ps": self.ps, "C": self.C, "D": self.D}
+        if not self.separable:
+            state["B"] = self.B
+        return state
+
+    def set_state(self, state):
+        self.mean = state["mean"]
+        self.sigma = float(state["sigma"])
+        self.pc = state["pc"]
+        self.ps = state["ps"]
+        self.C = state["C"]
+        self.D = state["D"]
+        self.B = state["B"] if not self.separable else None
+
+    def sample(self):
+        z = np.random.randn(self.population_size, self.gene_count)
+        if self.separable:
+            return z * self.D
+        return (z * self.D) @ self.B.T
+
+    def next_generation(self):
+        n = self.gene_count
+        flat_pop = self.get_flat_pop()
+        genes = self.mean + self.sigma * self.sample()
+        flat_pop[:, :n] = genes
+        flat_pop[:, n:] = self.sigma
+        for chromosome in flat_pop:
+            chromosome[:] = self.Player.normalize(chromosome)
+        y = (flat_pop[:, :n] - self.mean) / self.sigma
+
+        with memory.subsystem("tournament.jobs"):
+            jobs = [GameJob(self.Player.name, chromosome[None], self.games_per_candidate,
+                            opponent_name=self.opponent_names, race_mode=self.race_mode, record_dir=self.record_dir)
+                    for chromosome in flat_pop]
+        fitness = np.empty(self.population_size)
+        all_win_counts = iter(self.runner.run(jobs))
+        for i in range(self.population_size):
+            with timer.phase("tournament.games"), memory.subsystem("tournament.games"):
+                fitness[i] = next(all_win_counts)[0] / self.games_per_candidate
+            self.total_game_count += self.games_per_candidate
+            timer.game_count += self.games_per_candidate
+            self.cur_tournament_count += 1
+            self.progress_bar.update(self.cur_tournament_count)
+
+        with timer.phase("cma_es.update"), memory.subsystem("cma_es.update"):
+            self.update_distribution(y[np.argsort(-fitness)[:self.mu]])
+
+    def update_distribution(self, y_selected):
+        n = self.gene_count
+        y_w = self.weights @ y_selected
+        self.mean = self.mean + self.sigma * y_w
+
+        if self.separable:
+            c_inv_sqrt_y_w = y_w / self.D
+        else:
+            c_inv_sqrt_y_w = self.B @ ((self.B.T @ y_w) / self.D)
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(self.cs * (2 - self.cs) * self.mueff) * c_inv_sqrt_y_w
+        generation = self.current_generation + 1
+        ps_norm = np.linalg.norm(self.ps)
+        h_sig = ps_norm / np.sqrt(1 - (1 - self.cs) ** (2 * generation)) / self.chi_n < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + h_sig * np.sqrt(self.cc * (2 - self.cc) * self.mueff) * y_w
+
+        rank_one_correction = (1 - h_sig) * self.cc * (2 - self.cc)
+        if self.separable:
+            rank_mu = self.weights @ (y_selected ** 2)
+            rank_one = self.pc ** 2 + rank_one_correction * self.C
+        else:
+            rank_mu = np.einsum('i,ij,ik->jk', self.weights, y_selected, y_selected)
+            rank_one = np.outer(self.pc, self.pc) + rank_one_correction * self.C
+        self.C = (1 - self.c1 - self.cmu) * self.C + self.c1 * rank_one + self.cmu * rank_mu
+        self.sigma *= np.exp((self.cs / self.damps) * (ps_norm / self.chi_n - 1))
+
+        if self.separable:
+            self.D = np.sqrt(self.C)
+        else:
+            self.C = np.triu(self.C) + np.triu(self.C, 1).T
+            eigenvalues, self.B = np.linalg.eigh(self.C)
+            self.D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+
+selections = [TournamentSelection, CellularTournamentSelection, IslandTournamentSelection, CMAESSelection]
+selection_map = {selection.name: selection for selection in selections}
 
 
 def get_selection(name):
-    selections = [TournamentSelection, CellularTournamentSelection, IslandTournamentSelection]
-    selector_map = {}
-    for selection in selections:
-        selector_map[selection.name] = selection
-    return selector_map[name]
+    return selection_map[name]
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+
+from ga_utils import load_scores
+from chromosome_store import get_population_path, load_population
+
+
+class BaseSurrogate:
+    name = "base"
+    args = []
+    gene_count = None
+    candidate_count = 1
+    sample_count = 0
+
+    def is_ready(self):
+        return False
+
+    def update(self, chromosomes: np.ndarray, fitness: np.ndarray):
+        pass
+
+    def predict(self, chromosomes: np.ndarray):
+        pass
+
+    def warm_start(self, folder_path):
+        # (chromosome, win rate) pairs from the run's own *.scores.*.npy files, relative to the generation mean
+        generation_ids, score_matrices = load_scores(folder_path)
+        pair_count = 0
+        for generation_id, score_matrix in zip(generation_ids, score_matrices):
+            pop_path = get_population_path(folder_path, generation_id)
+            if len(score_matrix.shape) != 2 or not os.path.exists(pop_path):
+                continue
+            chromosome_idx = score_matrix[0].astype(int)
+            scores = score_matrix[1]
+            self.update(load_population(pop_path, chromosome_idx), scores - scores.mean())
+            pair_count += len(scores)
+        return pair_count
+
+
+class QuadraticSurrogate(BaseSurrogate):
+    """
+    Ridge regression on the genes, their squares and a bias, refit incrementally by recursive least squares.
+    The fitness is the win rate relative to the other chromosomes it was measured with.
+    """
+    name = "quadratic"
+    args = [("candidate_count", int), ("forgetting", float)]
+    max_gene_count = 64
+
+    def __init__(self, gene_count, candidate_count, forgetting):
+        assert gene_count <= self.max_gene_count, "the quadratic surrogate is meant for low dimensional players"
+        self.gene_count = gene_count
+        self.candidate_count = candidate_count
+        self.forgetting = forgetting
+        feature_count = 2 * gene_count + 1
+        self.weights = np.zeros(feature_count)
+        self.precision_inv = np.eye(feature_count) * 100.
+        self.sample_count = 0
+
+    def features(self, chromosomes):
+        genes = chromosomes[:, :self.gene_count]
+        return np.concatenate((genes, genes ** 2, np.ones((len(genes), 1))), axis=1)
+
+    def is_ready(self):
+        return self.sample_count >= 4 * len(self.weights)
+
+    def update(self, chromosomes, fitness):
+        for x, y in zip(self.features(chromosomes), fitness):
+            p_x = self.precision_inv @ x
+            gain = p_x / (self.forgetting + x @ p_x)
+            self.weights += gain * (y - x @ self.weights)
+            self.precision_inv = (self.precision_inv - np.outer(gain, p_x)) / self.forgetting
+        self.sample_count += len(fitness)
+
+    def predict(self, chromosomes):
+        return self.features(chromosomes) @ self.weights
+
+
+surrogates = [QuadraticSurrogate]
+surrogate_map = {surrogate.name: surrogate for surrogate in surrogates}
+
+
+def get_surrogate(name):
+    return surrogate_map[name]
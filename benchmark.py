@@ -0,0 +1,170 @@
+"""
+Time-to-target benchmark of run_ga configurations.
+
+Every configuration is trained for a fixed wall-clock budget on a fixed number of cores, once per seed, one run at a
+time so runs do not compete for cores. The saved generations are then evaluated against an opponent, and the wall
+time and game count of the first generation reaching each win rate target are compared across configurations.
+
+A spec is a json file like
+
+{
+    "configs": {
+        "tournament": {"player": ["simple"], "selection": ["tournament", "population_size=100", ...],
+                       "recombination": ["none"], "mutation": ["one_step", "lr=0.5"]},
+        "cma_es": {..., "args": ["--race_mode", "sample"]}
+    },
+    "save_nth_gen": 5
+}
+
+where "args" are optional extra run_ga arguments.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+from game_jobs import GameJob, PoolRunner
+from scheduler import ScheduledRunner
+from ga_utils import load_opponent_scores
+from run_config import get_folder_name
+from telemetry import read_telemetry
+from chromosome_store import get_generation_ids, get_population_path, load_population, population_size
+
+
+def run_folder(out_dir, config):
+    return "{}/{}".format(out_dir, get_folder_name(config["player"], config["selection"], config["recombination"],
+                                                  config["mutation"]))
+
+
+def train(config, out_dir, seed, cores, time_budget, save_nth_gen, log_path):
+    command = [sys.executable, "run_ga.py", "--player", *config["player"], "--selection", *config["selection"],
+               "--recombination", *config["recombination"], "--mutation", *config["mutation"],
+               "--gen_count", "0", "--save_nth_gen", str(save_nth_gen), "--process_count", str(cores),
+               "--seed", str(seed), "--time_budget", str(time_budget), "--out_dir", out_dir, *config.get("args", [])]
+    with open(log_path, "a") as log_file:
+        return subprocess.call(command, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def evaluate(folder_path, runner, opponent_name, chromosome_count, games_per_chromosome):
+    # same score files as eval_population, so the runs can be plotted with plot_score as well
+    player_name = os.path.basename(folder_path).split("+")[0].split("-")[0]
+    for generation in sorted(get_generation_ids(folder_path)):
+        scores_path = "{}/{}.scores.{}.npy".format(folder_path, generation, opponent_name)
+        if os.path.exists(scores_path):
+            continue
+        population_path = get_population_path(folder_path, generation)
+        pop_size = population_size(population_path)
+        n = min(pop_size, chromosome_count)
+        population_idx = np.sort(np.random.choice(pop_size, n, replace=False))
+        population = load_population(population_path, population_idx)
+        jobs = [GameJob(player_name, chromosome[None], games_per_chromosome, opponent_name)
+                for chromosome in population]
+        save_matrix = np.empty((2, n))
+        save_matrix[0] = population_idx
+        save_matrix[1] = [win_counts[0] / games_per_chromosome for win_counts in runner.run(jobs)]
+        np.save(scores_path, save_matrix)
+
+
+def time_to_targets(folder_path, opponent_name, targets):
+    """(wall time, game count) of the first evaluated generation reaching each target, None if never reached."""
+    telemetry = {record["generation"]: record for record in read_telemetry(folder_path + "/telemetry.jsonl")}
+    scores = load_opponent_scores(folder_path, opponent_name)
+    results = []
+    for target in targets:
+        reached = [generation for generation in sorted(scores)
+                   if generation in telemetry and scores[generation].mean() >= target]
+        if reached:
+            record = telemetry[reached[0]]
+            results.append((record["wall_time"], record["total_game_count"]))
+        else:
+            results.append(None)
+    return results
+
+
+def bootstrap_ci(values, sample_count=10000, level=0.95):
+    values = np.asarray(values, np.float64)
+    if len(values) < 2:
+        return values.mean(), values.mean()
+    means = values[np.random.randint(len(values), size=(sample_count, len(values)))].mean(axis=1)
+    return tuple(np.percentile(means, [50 * (1 - level), 50 * (1 + level)]))
+
+
+def summarize(values):
+    if not values:
+        return "-"
+    low, high = bootstrap_ci(values)
+    return "{:.4g} [{:.4g}, {:.4g}]".format(np.mean(values), low, high)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spec", type=str, required=True)
+    parser.add_argument("--cores", type=int, required=True)
+    parser.add_argument("--time_budget", type=float, required=True, help="seconds of training per run")
+    parser.add_argument("--seeds", type=int, nargs='+', default=[0, 1, 2, 3, 4])
+    parser.add_argument("--targets", type=float, nargs='+', default=[0.5, 0.6])
+    parser.add_argument("--opponent_name", type=str, default="random")
+    parser.add_argument("--chromosomes_per_generation", type=int, default=20)
+    parser.add_argument("--games_per_chromosome", type=int, default=100)
+    parser.add_argument("--report_only", action="store_const", const=True, default=False,
+                        help="only evaluate and report the runs that already exist")
+    parser.add_argument("--scheduler", action="store_const", const=True, default=False,
+                        help="balance the evaluation games over the cores by their learned cost")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    bench_dir = os.path.splitext(args.spec)[0] + ".bench"
+    os.makedirs(bench_dir, exist_ok=True)
+    if args.scheduler:
+        runner = ScheduledRunner(args.cores, bench_dir + "/job_costs.json")
+    else:
+        runner = PoolRunner(args.cores)
+
+    # seeds outermost, so a partial benchmark covers every configuration
+    for seed in args.seeds:
+        for label, config in spec["configs"].items():
+            out_dir = "{}/{}/seed-{}".format(bench_dir, label, seed)
+            folder_path = run_folder(out_dir, config)
+            if not os.path.isdir(folder_path) and not args.report_only:
+                print("training {} seed {}".format(label, seed))
+                code = train(config, out_dir, seed, args.cores, args.time_budget, spec["save_nth_gen"],
+                             "{}/{}.seed-{}.log".format(bench_dir, label, seed))
+                if code != 0:
+                    print("run_ga exited with {}, see the log".format(code))
+            if os.path.isdir(folder_path):
+                evaluate(folder_path, runner, args.opponent_name, args.chromosomes_per_generation,
+                         args.games_per_chromosome)
+
+    header = ["config", "target", "reached", "wall time (s)", "games"]
+    rows = []
+    results = {}
+    for label, config in spec["configs"].items():
+        results[label] = {}
+        folder_paths = [run_folder("{}/{}/seed-{}".format(bench_dir, label, seed), config) for seed in args.seeds]
+        folder_paths = [path for path in folder_paths if os.path.exists(path + "/telemetry.jsonl")]
+        run_results = [time_to_targets(path, args.opponent_name, args.targets) for path in folder_paths]
+        for target_id, target in enumerate(args.targets):
+            reached = [run[target_id] for run in run_results if run[target_id] is not None]
+            wall_times = [wall_time for wall_time, _ in reached]
+            game_counts = [game_count for _, game_count in reached]
+            results[label][target] = {"runs": len(run_results), "wall_times": wall_times, "game_counts": game_counts}
+            rows.append([label, "{:.2f}".format(target), "{}/{}".format(len(reached), len(run_results)),
+                         summarize(wall_times), summarize(game_counts)])
+
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    table = "\n".join(lines[:1] + ["  ".join("-" * width for width in widths)] + lines[1:])
+    print(table)
+    with open(bench_dir + "/results.txt", "w") as f:
+        f.write(table + "\n")
+    with open(bench_dir + "/results.json", "w") as f:
+        json.dump({"time_budget": args.time_budget, "cores": args.cores, "opponent_name": args.opponent_name,
+                   "seeds": args.seeds, "results": results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Content addressed chromosome storage.
+
+Every distinct chromosome of a run is stored once, as chromosomes/<sha1>.npy in the run folder, and a generation is
+saved as N.popref.npy, the array of the hashes of its chromosomes. Consecutive generations mostly share their
+surviving chromosomes, so a save only writes the new ones. Readers should go through load_population, which reads
+both N.pop.npy and N.popref.npy files.
+"""
+import os
+import glob
+import hashlib
+
+import numpy as np
+
+hash_dtype = "S40"
+
+
+def chromosome_hash(chromosome):
+    return hashlib.sha1(np.ascontiguousarray(chromosome).tobytes()).hexdigest()
+
+
+class ChromosomeStore:
+    def __init__(self, folder_path):
+        self.path = folder_path + "/chromosomes"
+        os.makedirs(self.path, exist_ok=True)
+        self.known = {name.split(".")[0] for name in os.listdir(self.path) if name.count(".") == 1}
+
+    def put(self, chromosome):
+        key = chromosome_hash(chromosome)
+        if key not in self.known:
+            writing_path = "{}/{}.writing.npy".format(self.path, key)
+            np.save(writing_path, chromosome)
+            os.rename(writing_path, "{}/{}.npy".format(self.path, key))
+            self.known.add(key)
+        return key
+
+    def save_population(self, path, population):
+        # the chromosomes are written before the references, so a visible reference file is always complete
+        refs = np.array([self.put(chromosome) for chromosome in population], hash_dtype)
+        writing_path = path[:-len(".npy")] + ".writing.npy"
+        np.save(writing_path, refs)
+        os.rename(writing_path, path)
+
+
+def get_population_paths(folder_path):
+    return glob.glob(folder_path + "/*.pop.npy") + glob.glob(folder_path + "/*.popref.npy")
+
+
+def get_generation_ids(folder_path):
+    return [int(os.path.basename(path).split(".")[0]) for path in get_population_paths(folder_path)]
+
+
+def get_population_path(folder_path, generation):
+    path = "{}/{}.pop.npy".format(folder_path, generation)
+    if os.path.exists(path):
+        return path
+    return "{}/{}.popref.npy".format(folder_path, generation)
+
+
+def population_size(path):
+    return len(np.load(path, mmap_mode='r'))
+
+
+def load_population(path, idx=None):
+    """The population saved at path, or only its rows idx. Only the requested chromosomes are read."""
+    if path.endswith(".popref.npy"):
+        refs = np.load(path)
+        if idx is not None:
+            refs = refs[idx]
+        store_path = os.path.dirname(path) + "/chromosomes"
+        return np.array([np.load("{}/{}.npy".format(store_path, ref.decode())) for ref in refs])
+    population = np.load(path, mmap_mode='r')
+    return np.array(population if idx is None else population[idx])
+
+
+def load_chromosome(path, row=0):
+    """The chromosome saved at path, or row of the population saved at path."""
+    if not path.endswith(".popref.npy"):
+        chromosome = np.load(path, mmap_mode='r')
+        if chromosome.ndim == 1:
+            return np.array(chromosome)
+    return load_population(path, [row])[0]
@@ -0,0 +1,110 @@
+"""
+Compact board representation: the 16 token positions of a state as an int8 array,
+rows being players relative to the player to move, as in pyludo states.
+"""
+import numpy as np
+
+from pyludo import LudoState
+
+POSITION_COUNT = 101  # positions -1 to 99
+_rotation_src = None
+_rotation_lut = None
+
+
+def pack(state, out):
+    for player_id in range(4):
+        out[player_id] = state[player_id]
+    return out
+
+
+def _build_rotation_tables():
+    # the maps are read off pyludo's own get_state_relative_to_player, one token at a time
+    src = np.empty((4, 16), np.intp)
+    lut = np.empty((4, 16, POSITION_COUNT), np.int64)
+    for rel_player in range(4):
+        for row in range(4):
+            marker = np.full((4, 4), -1)
+            marker[row] = 99
+            relative = LudoState(marker).get_state_relative_to_player(rel_player)
+            dest_row = next(r for r in range(4) if relative[r][0] == 99)
+            for token_id in range(4):
+                src[rel_player, dest_row * 4 + token_id] = row * 4 + token_id
+            for position in range(-1, 100):
+                probe = np.full((4, 4), -1)
+                probe[row][0] = position
+                relative = LudoState(probe).get_state_relative_to_player(rel_player)
+                lut[rel_player, dest_row * 4:dest_row * 4 + 4, position + 1] = relative[dest_row][0]
+    return src, lut
+
+
+def relative_boards(board):
+    """The board as seen from each of the four players, shape (4, 4, 4)."""
+    global _rotation_src, _rotation_lut
+    if _rotation_src is None:
+        _rotation_src, _rotation_lut = _build_rotation_tables()
+    values = board.reshape(16)[_rotation_src].astype(np.intp) + 1
+    return _rotation_lut[np.arange(4)[:, None], np.arange(16)[None, :], values].reshape((4, 4, 4))
+
+
+class MoveBuffer:
+    """
+    Reusable buffers for one decision: the packed board, the packed candidate next states,
+    and which candidates are identical up to the order of a player's tokens, so they only need to be scored once.
+    """
+
+    def __init__(self):
+        self.board = np.empty((4, 4), np.int8)
+        self.candidates = np.empty((4, 4, 4), np.int8)
+        self.canonical = np.empty((4, 4, 4), np.int8)
+        self.legal = np.zeros(4, bool)
+        self.representative = np.arange(4)
+        self.unique_ids = []
+        self.state = None
+        self.dice_roll = None
+        self.next_states = None
+
+    def load(self, state, dice_roll, next_states):
+        self.state = state
+        self.dice_roll = dice_roll
+        self.next_states = next_states
+        pack(state, self.board)
+        for action_id in range(4):
+            next_state = next_states[action_id]
+            self.legal[action_id] = next_state is not False
+            if next_state is not False:
+                pack(next_state, self.candidates[action_id])
+        return self.deduplicate()
+
+    def load_packed(self, board, candidates, legal, dice_roll=None):
+        """Loads a decision that is already packed, e.g. from a game record."""
+        self.state = self.next_states = None
+        self.dice_roll = dice_roll
+        self.board[:] = board
+        self.candidates[:] = candidates
+        self.legal[:] = legal
+        return self.deduplicate()
+
+    def deduplicate(self):
+        unique_ids = []
+        self.canonical[:] = self.candidates
+        self.canonical.sort(axis=2)
+        first_ids = {}
+        for action_id in range(4):
+            self.representative[action_id] = action_id
+            if not self.legal[action_id]:
+                continue
+            unique_id = first_ids.setdefault(self.canonical[action_id].tobytes(), action_id)
+            if unique_id == action_id:
+                unique_ids.append(action_id)
+            else:
+                self.representative[action_id] = unique_id
+        self.unique_ids = unique_ids
+        return self
+
+    def spread(self, unique_scores, illegal_score=-1e9):
+        """Scores for all four actions from the scores of the unique candidates."""
+        scores = np.full(4, illegal_score)
+        scores[self.unique_ids] = unique_scores
+        legal_ids = np.flatnonzero(self.legal)
+        scores[legal_ids] = scores[self.representative[legal_ids]]
+        return scores
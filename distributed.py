@@ -0,0 +1,163 @@
+"""
+Coordinator/worker mode for playing game jobs on several machines.
+
+The coordinator listens on a TCP port and hands out one job at a time to every connected worker.
+Workers may connect and disconnect at any time. A job whose worker disconnects, dies or times out
+is put back in the queue and given to another worker.
+
+Messages are pickled, so only run this on a trusted network.
+"""
+import argparse
+import pickle
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+_header = struct.Struct("!Q")
+
+
+def send_message(sock: socket.socket, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_header.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("connection closed")
+        received += n
+    return bytes(buf)
+
+
+def recv_message(sock: socket.socket):
+    size, = _header.unpack(_recv_exact(sock, _header.size))
+    return pickle.loads(_recv_exact(sock, size))
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class Coordinator:
+    name = "distributed"
+
+    def __init__(self, host, port, job_timeout=None):
+        self.job_timeout = job_timeout
+        self.server = socket.create_server((host, port))
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.jobs = {}
+        self.results = {}
+        self.next_job_id = 0
+        self.worker_count = 0
+        self.closed = False
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while not self.closed:
+            try:
+                conn, address = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_worker, args=(conn, address), daemon=True).start()
+
+    def _next_job_id(self):
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            return self.pending.popleft()
+
+    def _serve_worker(self, conn: socket.socket, address):
+        with self.condition:
+            self.worker_count += 1
+        print("worker {} joined ({} connected)".format(address, self.worker_count))
+        job_id = None
+        try:
+            conn.settimeout(self.job_timeout)
+            recv_message(conn)  # hello
+            while True:
+                job_id = self._next_job_id()
+                if job_id is None:
+                    send_message(conn, ("bye",))
+                    return
+                send_message(conn, ("job", job_id, self.jobs[job_id]))
+                kind, result_job_id, win_counts = recv_message(conn)
+                assert kind == "result" and result_job_id == job_id
+                with self.condition:
+                    self.results[job_id] = win_counts
+                    self.condition.notify_all()
+                job_id = None
+        except (OSError, EOFError, ConnectionError, pickle.UnpicklingError, AssertionError):
+            pass
+        finally:
+            conn.close()
+            with self.condition:
+                self.worker_count -= 1
+                if job_id is not None and job_id not in self.results:
+                    self.pending.appendleft(job_id)
+                    self.condition.notify_all()
+            print("worker {} left ({} connected)".format(address, self.worker_count))
+
+    def run(self, jobs):
+        with self.condition:
+            job_ids = []
+            for job in jobs:
+                job_id = self.next_job_id
+                self.next_job_id += 1
+                self.jobs[job_id] = job
+                self.pending.append(job_id)
+                job_ids.append(job_id)
+            self.condition.notify_all()
+            while not all(job_id in self.results for job_id in job_ids):
+                self.condition.wait()
+            results = [self.results.pop(job_id) for job_id in job_ids]
+            for job_id in job_ids:
+                del self.jobs[job_id]
+        return results
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.server.close()
+
+
+def worker(host, port, retry_delay=1.):
+    from game_jobs import play_job
+
+    while True:
+        try:
+            with socket.create_connection((host, port)) as sock:
+                send_message(sock, ("hello", socket.gethostname()))
+                while True:
+                    message = recv_message(sock)
+                    if message[0] == "bye":
+                        return
+                    _, job_id, job = message
+                    send_message(sock, ("result", job_id, play_job(job)))
+        except (OSError, EOFError, ConnectionError):
+            time.sleep(retry_delay)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--coordinator", type=str, required=True)
+    parser.add_argument("--retry_delay", type=float, default=1.)
+    args = parser.parse_args()
+
+    host, port = parse_address(args.coordinator)
+    print("working for coordinator {}:{}".format(host, port))
+    worker(host, port, args.retry_delay)
+
+
+if __name__ == '__main__':
+    main()
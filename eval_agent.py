@@ -5,9 +5,12 @@ import os
 import numpy as np
 from progressbar import ProgressBar, Percentage
 
-from pyludo import LudoGame, LudoPlayerRandom
+from pyludo import LudoPlayerRandom
 from SmartPlayer import SmartPlayer
 from GAPlayers import get_ga_player
+from game_engine import play_game
+from game_records import get_recorder
+from chromosome_store import load_chromosome
 
 fixed_players = {
     "random": LudoPlayerRandom,
@@ -16,15 +19,16 @@ fixed_players = {
 
 
 def get_player(player_args):
-    assert 1 <= len(player_args) <= 2
+    # name, or name path [row], path being a single chromosome or a population
+    assert 1 <= len(player_args) <= 3
     if len(player_args) == 1:
         return fixed_players[player_args[0]]()
     Player = get_ga_player(player_args[0])
-    chromosome = np.load(player_args[1])
+    chromosome = load_chromosome(player_args[1], int(player_args[2]) if len(player_args) == 3 else 0)
     return Player(chromosome)
 
 
-def tournament(_players, game_count):
+def tournament(_players, game_count, recorder=None):
     progress_bar = ProgressBar(widgets=[Percentage()], maxval=game_count).start()
 
     players = [player for player in _players]
@@ -34,9 +38,9 @@ def tournament(_players, game_count):
     win_rates = np.zeros(4)
     for i in range(game_count):
         random.shuffle(players)
-        game = LudoGame(players)
-        winner = players[game.play_full_game()]
-        win_rates[tournament_player_ids[winner]] += 1
+        credits = play_game(players, recorder=recorder)
+        for seat, player in enumerate(players):
+            win_rates[tournament_player_ids[player]] += credits[seat]
         progress_bar.update(i + 1)
 
     progress_bar.finish()
@@ -49,6 +53,7 @@ def main():
     parser.add_argument("--opponent", nargs="+")
     parser.add_argument("--compare", action='store_const', const=True, default=False)
     parser.add_argument("--game_count", type=int, required=True)
+    parser.add_argument("--record_dir", type=str, help="record every decision of the games here")
     args = parser.parse_args()
 
     player = get_player(args.player)
@@ -61,7 +66,8 @@ def main():
         dist = (2, 2)
 
     players = [player] * dist[0] + [opponent] * dist[1]
-    win_rates = tournament(players, args.game_count)
+    recorder = None if args.record_dir is None else get_recorder(args.record_dir)
+    win_rates = tournament(players, args.game_count, recorder)
     player_win_rate = np.sum(win_rates[:dist[1]])
 
     eval_folder_path = "agent_evaluations"
@@ -8,9 +8,14 @@ import numpy as np
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from pyludo import LudoGame
+from game_engine import play_game
+from game_jobs import GameJob, play_stacked
+from scheduler import ScheduledRunner
+from game_records import get_recorder
 from GAPlayers import get_ga_player
 from ga_utils import get_opponent_class
+from chromosome_store import load_population, population_size
+from instrumentation import worker_rss_bytes
 
 
 def get_score_file_name(generation_id, opponent_name):
@@ -21,38 +26,72 @@ def get_score_file_path(folder_path, generation_id, opponent_name):
     return "{}/{}".format(folder_path, get_score_file_name(generation_id, opponent_name))
 
 
-def eval_population_worker(queue: mp.Queue, games_per_chromosome, task_counter_queue: mp.Queue, Opponent):
+def sample_population(population_path):
+    # only the sampled chromosomes are read
+    pop_size = population_size(population_path)
+    N = min(pop_size, 20)
+    population_idx = np.sort(np.random.choice(np.arange(pop_size), N, replace=False))
+    save_matrix = np.empty((2, N), np.float64)
+    save_matrix[0] = population_idx
+    return load_population(population_path, population_idx), save_matrix
+
+
+def save_scores(population_path, Opponent, save_matrix):
+    folder_path = os.path.dirname(population_path)
+    generation_str = os.path.basename(population_path).split(".")[0]
+    scores_path = get_score_file_path(folder_path, generation_str, Opponent.name)
+    assert not os.path.exists(scores_path), "Scores already exists: {}".format(scores_path)
+    np.save(scores_path, save_matrix)
+
+
+def eval_population_worker(queue: mp.Queue, games_per_chromosome, task_counter_queue: mp.Queue, Opponent,
+                           race_mode=None, stacked=False, record_dir=None):
+    # players are created once per worker and reused for every chromosome and game
+    opponents = [Opponent() for _ in range(3)]
+    recorder = None if record_dir is None else get_recorder(record_dir)
+    ga_players = {}
     while True:
         population_path = queue.get()
-        folder_path = os.path.dirname(population_path)
-        folder_name = os.path.basename(folder_path)
-
-        player_name = folder_name.split("+")[0]
+        player_name = os.path.basename(os.path.dirname(population_path)).split("+")[0]
         Player = get_ga_player(player_name)
 
-        population = np.load(population_path)
-        N = min(len(population), 20)
-        population_idx = np.random.choice(np.arange(len(population)), N, replace=False)
-        population = population[population_idx]
-        save_matrix = np.empty((2, N), np.float)
-        save_matrix[0] = population_idx
+        population, save_matrix = sample_population(population_path)
         scores = save_matrix[1]
-        for i, chromosome in enumerate(population):
-            players = [Player(chromosome)] + [Opponent() for _ in range(3)]
-            win_count = 0
-            for _ in range(games_per_chromosome):
-                random.shuffle(players)
-                game = LudoGame(players)
-                winner = players[game.play_full_game()]
-                if isinstance(winner, Player):
-                    win_count += 1
-            scores[i] = win_count / games_per_chromosome
-
-        generation_str = os.path.basename(population_path).split(".")[0]
-        scores_path = get_score_file_path(folder_path, generation_str, Opponent.name)
-        assert not os.path.exists(scores_path), "Scores already exists: {}".format(scores_path)
-        np.save(scores_path, save_matrix)
+        if stacked and Player.stackable:
+            scores[:] = play_stacked(Player, population, Opponent, games_per_chromosome, race_mode)
+            scores /= games_per_chromosome
+        else:
+            for i, chromosome in enumerate(population):
+                if Player not in ga_players:
+                    ga_players[Player] = Player(chromosome)
+                player = ga_players[Player]
+                player.set_chromosome(chromosome)
+                players = [player] + opponents
+                win_count = 0
+                for _ in range(games_per_chromosome):
+                    random.shuffle(players)
+                    win_count += play_game(players, race_mode, recorder)[players.index(player)]
+                scores[i] = win_count / games_per_chromosome
+            if recorder is not None:
+                recorder.flush()
+
+        save_scores(population_path, Opponent, save_matrix)
+        task_counter_queue.put(('finished', population_path))
+
 
+def eval_population_scheduled(queue: mp.Queue, games_per_chromosome, task_counter_queue: mp.Queue, Opponent,
+                              process_count, race_mode=None, record_dir=None, cost_path=None):
+    # one population at a time, its games balanced over all processes by the scheduler
+    runner = ScheduledRunner(process_count, cost_path)
+    while True:
+        population_path = queue.get()
+        player_name = os.path.basename(os.path.dirname(population_path)).split("+")[0]
+        population, save_matrix = sample_population(population_path)
+        jobs = [GameJob(player_name, chromosome[None], games_per_chromosome, Opponent.name, race_mode, record_dir)
+                for chromosome in population]
+        save_matrix[1] = [win_counts[0] / games_per_chromosome for win_counts in runner.run(jobs)]
+        print("worker utilization: {:.1%}".format(runner.utilization()))
+        save_scores(population_path, Opponent, save_matrix)
         task_counter_queue.put(('finished', population_path))
 
 
@@ -64,7 +103,7 @@ def handle_file_path_worker(path_queue: mp.Queue, population_queue: mp.Queue, ta
             continue
         file_name = os.path.basename(file_path)
         name_parts = file_name.split(".")
-        if len(name_parts) != 3 or name_parts[1] != "pop":
+        if len(name_parts) != 3 or name_parts[1] not in ("pop", "popref"):
             continue
         generation_str = name_parts[0]
         folder_path = os.path.dirname(file_path)
@@ -92,10 +131,19 @@ def main():
     parser.add_argument("--games_per_chromosome", type=int, required=True)
     parser.add_argument("--process_count", type=int, required=True)
     parser.add_argument("--opponent_name", type=str, required=True)
+    parser.add_argument("--race_mode", choices=["sample", "credit"])
+    parser.add_argument("--stacked", action="store_const", const=True, default=False,
+                        help="play the games of all sampled chromosomes side by side with batched inference")
+    parser.add_argument("--record_dir", type=str, help="record every decision of the evaluation games here")
+    parser.add_argument("--scheduler", action="store_const", const=True, default=False,
+                        help="score one population at a time, with its games balanced over the processes by cost")
+    parser.add_argument("--memory", action="store_const", const=True, default=False,
+                        help="report the RSS of the worker processes with every task")
     args = parser.parse_args()
 
     path = args.path
     assert os.path.isdir(args.path)
+    assert not (args.stacked and args.record_dir), "stacked games are interleaved and can not be recorded"
     games_per_chromosome = args.games_per_chromosome
     process_count = args.process_count
     opponent_name = args.opponent_name
@@ -109,14 +157,21 @@ def main():
                              args=(path_queue, population_queue, task_counter_queue, Opponent))
     path_worker.start()
 
-    pool = mp.Pool(process_count, eval_population_worker,
-                   (population_queue, games_per_chromosome, task_counter_queue, Opponent))
+    if args.scheduler:
+        pool = mp.Process(target=eval_population_scheduled,
+                          args=(population_queue, games_per_chromosome, task_counter_queue, Opponent, process_count,
+                                args.race_mode, args.record_dir, path + "/job_costs.json"))
+        pool.start()
+    else:
+        pool = mp.Pool(process_count, eval_population_worker,
+                       (population_queue, games_per_chromosome, task_counter_queue, Opponent, args.race_mode,
+                        args.stacked, args.record_dir))
 
     observer = Observer()
     observer.schedule(FileCreatedHandler(path_queue), path=path, recursive=True)
     observer.start()
 
-    for file_path in glob(path + "/**/*.pop.npy", recursive=True):
+    for file_path in glob(path + "/**/*.pop.npy", recursive=True) + glob(path + "/**/*.popref.npy", recursive=True):
         path_queue.put(file_path)
 
     unfinished_tasks = 0
@@ -131,13 +186,18 @@ def main():
             elif action == 'finished':
                 unfinished_tasks -= 1
             print("pending tasks:", unfinished_tasks, action, pop_path)
+            if args.memory:
+                print("worker rss: {:.1f} MB".format(worker_rss_bytes() / 2 ** 20))
     except KeyboardInterrupt:
         pass
 
     print("stopping processes")
     path_worker.terminate()
     observer.stop()
-    pool.close()
+    if args.scheduler:
+        pool.terminate()
+    else:
+        pool.close()
 
     path_worker.join()
     print("path worker stopped")
@@ -4,6 +4,7 @@ import os
 from GAPlayers import get_ga_player
 from pyludo import LudoPlayerRandom, LudoPlayerDefensive
 from SmartPlayer import SmartPlayer
+from chromosome_store import get_population_paths, load_population
 
 
 def get_player_class(folder_path):
@@ -13,12 +14,12 @@ def get_player_class(folder_path):
     return Player, player_args
 
 
+opponents = [LudoPlayerRandom, LudoPlayerDefensive, SmartPlayer]
+opponent_map = {opponent.name: opponent for opponent in opponents}
+
+
 def get_opponent_class(opponent_name):
-    Opponents = [LudoPlayerRandom, LudoPlayerDefensive, SmartPlayer]
-    opp_map = {}
-    for opp in Opponents:
-        opp_map[opp.name] = opp
-    return opp_map[opponent_name]
+    return opponent_map[opponent_name]
 
 
 def load_scores(folder_path):
@@ -32,9 +33,9 @@ def load_scores(folder_path):
 
 def load_populations(folder_path):
     assert os.path.isdir(folder_path), "no folder found: {}".format(folder_path)
-    population_paths = glob.glob(folder_path + "/*.pop.npy")
+    population_paths = get_population_paths(folder_path)
     generation_ids = np.array([int(os.path.basename(path).split(".")[0]) for path in population_paths])
-    populations = np.array([np.load(f) for f in population_paths])
+    populations = np.array([load_population(f) for f in population_paths])
     idx = np.argsort(generation_ids)
     generation_ids = generation_ids[idx]
     populations = populations[idx]
@@ -43,3 +44,13 @@ def load_populations(folder_path):
     genes = populations[:, :, :gene_count]
     sigmas = populations[:, :, gene_count:]
     return generation_ids, genes, sigmas
+
+
+def load_opponent_scores(folder_path, opponent_name):
+    score_paths = glob.glob(folder_path + "/*.scores.{}.npy".format(opponent_name))
+    generation_ids = [int(os.path.basename(score_path).split(".")[0]) for score_path in score_paths]
+    scores = {}
+    for generation_id, score_path in zip(generation_ids, score_paths):
+        mat = np.load(score_path)
+        scores[generation_id] = mat[1] if len(mat.shape) == 2 else mat
+    return scores
@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+
+from pyludo import LudoGame, LudoState
+from race import get_race_table, is_race_state
+
+race_modes = [None, "sample", "credit"]
+
+
+class DeferredPlayer:
+    """A seat whose decisions game_loop hands to the caller instead of making them in place."""
+    name = "deferred"
+
+
+def play_game(players, race_mode=None, recorder=None):
+    """
+    Plays one game and returns the win credit of every seat.
+    With a race mode, the game ends as soon as the players can no longer interact, and the winner is either
+    sampled from the race table ("sample") or every seat is credited its win probability ("credit").
+    With a recorder, every decision of the game is recorded.
+    """
+    assert race_mode in race_modes
+    if race_mode is None and recorder is None:
+        credits = np.zeros(4)
+        credits[LudoGame(players).play_full_game()] = 1
+        return credits
+    loop = game_loop(players, race_mode, recorder)
+    try:
+        next(loop)
+    except StopIteration as stop:
+        return stop.value
+    raise ValueError("play_game does not take deferred players, use game_loop")
+
+
+def game_loop(players, race_mode=None, recorder=None):
+    """
+    Generator version of play_game.
+    Yields (seat, state, dice_roll, next_states) whenever a DeferredPlayer is to move and expects the chosen token
+    id to be sent back. The win credits are the return value.
+    """
+    assert race_mode in race_modes
+    race_table = None if race_mode is None else get_race_table()
+    credits = np.zeros(4)
+
+    # the turn structure mirrors LudoGame.step
+    state = LudoState()
+    current_player = 0
+    while True:
+        winner = state.get_winner()
+        if winner != -1:
+            credits[winner] = 1
+            break
+        if race_table is not None and is_race_state(state):
+            if race_mode == "sample":
+                winner = race_table.sample_winner(state, current_player)
+                credits[winner] = 1
+            else:
+                credits = race_table.win_probabilities(state, current_player)
+                if recorder is not None:
+                    # records need a winner, drawn from the same distribution the credits are
+                    winner = race_table.sample_winner(state, current_player)
+            break
+        dice_roll = random.randint(1, 6)
+        relative_state = state.get_state_relative_to_player(current_player)
+        next_states = [relative_state.move_token(token_id, dice_roll) for token_id in range(4)]
+        if any(next_state is not False for next_state in next_states):
+            player = players[current_player]
+            if isinstance(player, DeferredPlayer):
+                token_id = yield current_player, relative_state, dice_roll, next_states
+            else:
+                token_id = player.play(relative_state, dice_roll, next_states)
+            if recorder is not None:
+                recorder.record(player.name, current_player, relative_state, dice_roll, next_states, token_id)
+            state = next_states[token_id].get_state_relative_to_player((-current_player) % 4)
+        current_player = (current_player + 1) % 4
+    if recorder is not None:
+        recorder.end_game(winner)
+    return credits
@@ -0,0 +1,127 @@
+import random
+import multiprocessing as mp
+
+import numpy as np
+
+from compact_board import MoveBuffer
+from game_engine import DeferredPlayer, game_loop, play_game
+from game_records import get_recorder
+from instrumentation import timer
+from GAPlayers import get_ga_player
+from ga_utils import get_opponent_class
+
+
+class GameJob:
+    """
+    A batch of games between up to four chromosomes of one player type.
+    Empty seats are filled with fixed opponents, cycling through opponent_name if it is a list of names.
+    """
+
+    def __init__(self, player_name, chromosomes, game_count, opponent_name=None, race_mode=None, record_dir=None):
+        assert 1 <= len(chromosomes) <= 4
+        assert len(chromosomes) == 4 or opponent_name is not None
+        self.player_name = player_name
+        self.chromosomes = chromosomes
+        self.game_count = game_count
+        self.opponent_name = opponent_name
+        self.race_mode = race_mode
+        self.record_dir = record_dir
+
+
+def play_job(job: GameJob):
+    Player = get_ga_player(job.player_name)
+    players = [Player(chromosome) for chromosome in job.chromosomes]
+    if len(players) < 4:
+        opponent_names = job.opponent_name if isinstance(job.opponent_name, list) else [job.opponent_name]
+        players += [get_opponent_class(opponent_names[i % len(opponent_names)])()
+                    for i in range(4 - len(players))]
+    player_ids = {}
+    for i, player in enumerate(players):
+        player_ids[player] = i
+    recorder = None if job.record_dir is None else get_recorder(job.record_dir)
+    win_counts = np.zeros(4)
+    for _ in range(job.game_count):
+        random.shuffle(players)
+        credits = play_game(players, job.race_mode, recorder)
+        for seat, player in enumerate(players):
+            win_counts[player_ids[player]] += credits[seat]
+    if recorder is not None:
+        recorder.flush()
+    return win_counts[:len(job.chromosomes)]
+
+
+def play_stacked(Player, chromosomes, Opponent, game_count, race_mode=None):
+    """
+    Plays game_count games for every chromosome against three opponents, with the games of all chromosomes
+    running side by side, so each decision round is scored for all chromosomes in one batched operation.
+    Returns the win counts of the chromosomes.
+    """
+    assert Player.stackable, "{} players can not be stacked".format(Player.name)
+    n = len(chromosomes)
+    weights = Player.stack_weights(chromosomes)
+    opponents = [Opponent() for _ in range(3)]
+    moves = [MoveBuffer() for _ in range(n)]
+    win_counts = np.zeros(n)
+    games_started = np.zeros(n, int)
+    games = [None] * n  # (game loop, seat, pending decision) of every chromosome
+
+    def advance(i, token_id=None):
+        while True:
+            loop, seat, _ = games[i]
+            try:
+                decision = loop.send(token_id)
+                games[i] = loop, seat, decision
+                return
+            except StopIteration as stop:
+                win_counts[i] += stop.value[seat]
+                games[i] = None
+                token_id = None
+                if not start(i):
+                    return
+
+    def start(i):
+        if games_started[i] == game_count:
+            return False
+        games_started[i] += 1
+        players = [DeferredPlayer()] + opponents
+        random.shuffle(players)
+        seat = next(seat for seat, player in enumerate(players) if isinstance(player, DeferredPlayer))
+        games[i] = game_loop(players, race_mode), seat, None
+        return True
+
+    for i in range(n):
+        if start(i):
+            advance(i)
+    while any(game is not None for game in games):
+        moves_list = [None] * n
+        for i, game in enumerate(games):
+            if game is not None:
+                _, state, dice_roll, next_states = game[2]
+                moves_list[i] = moves[i].load(state, dice_roll, next_states)
+        with timer.phase(Player.name + ".eval_stacked"):
+            all_action_values = Player.eval_stacked(weights, moves_list)
+        for i, action_values in enumerate(all_action_values):
+            if action_values is not None:
+                timer.decision_count += 1
+                advance(i, Player.choose(action_values, moves[i].next_states))
+    timer.game_count += n * game_count
+    return win_counts
+
+
+class LocalRunner:
+    name = "local"
+
+    @staticmethod
+    def run(jobs):
+        # lazy, so results can be consumed while the remaining jobs are still to be played
+        return (play_job(job) for job in jobs)
+
+
+class PoolRunner:
+    name = "pool"
+
+    def __init__(self, process_count):
+        self.pool = mp.Pool(process_count)
+
+    def run(self, jobs):
+        return self.pool.imap(play_job, jobs)
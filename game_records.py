@@ -0,0 +1,107 @@
+"""
+Compact binary game records.
+
+Every decision is one fixed width record of int8 boards, relative to the player to move, so a log can be memory
+mapped and scored in batches. A log is a raw .rec file of record_dtype, plus a .rec.json sidecar with the names of
+the recorded players.
+"""
+import os
+import json
+import atexit
+import socket
+
+import numpy as np
+
+from compact_board import pack
+
+ILLEGAL = -128
+
+record_dtype = np.dtype([
+    ("game", np.int32),
+    ("player", np.int8),  # index into the player names of the log
+    ("dice", np.int8),
+    ("action", np.int8),
+    ("winner", np.int8),  # seat of the winner relative to the player to move
+    ("state", np.int8, (4, 4)),
+    ("next_states", np.int8, (4, 4, 4)),  # illegal moves are filled with ILLEGAL
+])
+
+
+class GameRecorder:
+    def __init__(self, path, flush_size=1 << 14):
+        self.path = path
+        self.flush_size = flush_size
+        self.buffer = np.zeros(flush_size, record_dtype)
+        self.size = 0
+        self.game_start = 0
+        self.game_id = 0
+        self.player_names = []
+        self.player_ids = {}
+        self.sidecar_path = path + ".json"
+        if os.path.exists(self.sidecar_path):
+            with open(self.sidecar_path) as f:
+                meta = json.load(f)
+            self.player_names = meta["player_names"]
+            self.player_ids = {name: i for i, name in enumerate(self.player_names)}
+            self.game_id = meta["game_count"]
+
+    def player_id(self, name):
+        if name not in self.player_ids:
+            self.player_ids[name] = len(self.player_names)
+            self.player_names.append(name)
+        return self.player_ids[name]
+
+    def record(self, player_name, seat, state, dice_roll, next_states, action):
+        if self.size == len(self.buffer):
+            self.buffer = np.concatenate((self.buffer, np.zeros(len(self.buffer), record_dtype)))
+        record = self.buffer[self.size]
+        record["game"] = self.game_id
+        record["player"] = self.player_id(player_name)
+        record["dice"] = dice_roll
+        record["action"] = action
+        record["winner"] = seat  # made relative once the winner is known
+        pack(state, record["state"])
+        for token_id, next_state in enumerate(next_states):
+            if next_state is False:
+                record["next_states"][token_id] = ILLEGAL
+            else:
+                pack(next_state, record["next_states"][token_id])
+        self.size += 1
+
+    def end_game(self, winner):
+        game_records = self.buffer[self.game_start:self.size]
+        game_records["winner"] = (winner - game_records["winner"]) % 4
+        self.game_id += 1
+        self.game_start = self.size
+        if self.size >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        # only finished games are written
+        with open(self.path, "ab") as f:
+            self.buffer[:self.game_start].tofile(f)
+        self.buffer[:self.size - self.game_start] = self.buffer[self.game_start:self.size]
+        self.size -= self.game_start
+        self.game_start = 0
+        with open(self.sidecar_path + ".writing", "w") as f:
+            json.dump({"player_names": self.player_names, "game_count": self.game_id}, f)
+        os.rename(self.sidecar_path + ".writing", self.sidecar_path)
+
+
+_recorders = {}
+
+
+def get_recorder(record_dir):
+    """One recorder per process and directory, flushed at exit."""
+    if record_dir not in _recorders:
+        os.makedirs(record_dir, exist_ok=True)
+        path = "{}/{}-{}.rec".format(record_dir, socket.gethostname(), os.getpid())
+        _recorders[record_dir] = recorder = GameRecorder(path)
+        atexit.register(recorder.flush)
+    return _recorders[record_dir]
+
+
+def load_records(path):
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    return np.memmap(path, record_dtype, mode='r'), meta["player_names"]
@@ -0,0 +1,151 @@
+"""
+Hall of fame of the best chromosomes of selected generations, rated by incremental Elo.
+
+The fixed opponents are entries too, with the random player anchored at a constant rating, so ratings are
+comparable across runs and over time. A new entry only plays matches against the entries rated closest to it,
+as those are the games whose outcome is least predictable.
+"""
+import os
+import json
+import random
+import argparse
+
+import numpy as np
+
+from GAPlayers import get_ga_player
+from ga_utils import get_opponent_class
+from game_engine import play_game
+from chromosome_store import get_generation_ids, get_population_path, load_population
+
+fixed_opponent_names = ["random", "defensive", "smart"]
+anchor_name = "random"
+anchor_rating = 1000.
+
+
+class HallOfFame:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + "/index.json"
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.entries = [{"id": "fixed-" + name, "player": name, "fixed": True, "rating": anchor_rating,
+                             "games": 0} for name in fixed_opponent_names]
+        self.entry_map = {entry["id"]: entry for entry in self.entries}
+        self.chromosomes = {}
+
+    def save(self):
+        with open(self.index_path + ".writing", "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.rename(self.index_path + ".writing", self.index_path)
+
+    def add(self, run_name, generation, player_name, chromosome, rating):
+        entry_id = "{}.{}".format(run_name, generation)
+        np.save("{}/{}.npy".format(self.path, entry_id), chromosome.astype(np.float32))
+        entry = {"id": entry_id, "run": run_name, "generation": generation, "player": player_name, "fixed": False,
+                 "rating": rating, "games": 0}
+        self.entries.append(entry)
+        self.entry_map[entry_id] = entry
+        return entry
+
+    def make_player(self, entry):
+        if entry["fixed"]:
+            return get_opponent_class(entry["player"])()
+        if entry["id"] not in self.chromosomes:
+            self.chromosomes[entry["id"]] = np.load("{}/{}.npy".format(self.path, entry["id"])).astype(np.float64)
+        return get_ga_player(entry["player"])(self.chromosomes[entry["id"]])
+
+    def run_entries(self, run_name):
+        return sorted((entry for entry in self.entries if entry.get("run") == run_name),
+                      key=lambda entry: entry["generation"])
+
+    def pick_opponents(self, entry, count=3):
+        # closest ratings first, entries with few games break near ties
+        candidates = [other for other in self.entries if other is not entry]
+        candidates.sort(key=lambda other: abs(other["rating"] - entry["rating"]) - 50 / (1 + other["games"]))
+        return candidates[:count]
+
+    def update_ratings(self, entries, credits, k):
+        # every pair of seats is a game scored by their share of the pair's credits, so with race mode "credit"
+        # the win probabilities count, and a plain win is a win over each loser
+        for i in range(len(entries)):
+            for j in range(i + 1, len(entries)):
+                total = credits[i] + credits[j]
+                if total == 0:
+                    continue
+                a, b = entries[i], entries[j]
+                expected = 1 / (1 + 10 ** ((b["rating"] - a["rating"]) / 400))
+                delta = k * (float(credits[i] / total) - expected)
+                if a["id"] != "fixed-" + anchor_name:
+                    a["rating"] += delta
+                if b["id"] != "fixed-" + anchor_name:
+                    b["rating"] -= delta
+
+    def play_match(self, entries, game_count, k, race_mode=None):
+        players = [self.make_player(entry) for entry in entries]
+        seats = list(range(4))
+        for _ in range(game_count):
+            random.shuffle(seats)
+            credits = play_game([players[seat] for seat in seats], race_mode)
+            self.update_ratings([entries[seat] for seat in seats], credits, k)
+            for entry in entries:
+                entry["games"] += 1
+
+
+def best_chromosome(folder_path, generation, opponent_name):
+    score_path = "{}/{}.scores.{}.npy".format(folder_path, generation, opponent_name)
+    if os.path.exists(score_path):
+        score_matrix = np.load(score_path)
+        best_id = int(score_matrix[0][np.argmax(score_matrix[1])])
+        return load_population(get_population_path(folder_path, generation), [best_id])[0]
+    winner_path = "{}/{}.pop.winner.npy".format(folder_path, generation)
+    if os.path.exists(winner_path):
+        return np.load(winner_path)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paths", nargs='+', required=True)
+    parser.add_argument("--hof_path", type=str, default="hall_of_fame")
+    parser.add_argument("--every_nth_gen", type=int, required=True)
+    parser.add_argument("--opponent_name", type=str, default="random",
+                        help="the scores against this opponent pick the best chromosome of a generation")
+    parser.add_argument("--matches_per_entry", type=int, default=10)
+    parser.add_argument("--games_per_match", type=int, default=20)
+    parser.add_argument("--k", type=float, default=8.)
+    parser.add_argument("--race_mode", choices=["sample", "credit"])
+    args = parser.parse_args()
+
+    hof = HallOfFame(args.hof_path)
+    for folder_path in args.paths:
+        folder_path = folder_path.rstrip("/")
+        run_name = os.path.basename(folder_path)
+        player_name = run_name.split("+")[0]
+        for generation in sorted(get_generation_ids(folder_path)):
+            if generation % args.every_nth_gen != 0 or "{}.{}".format(run_name, generation) in hof.entry_map:
+                continue
+            chromosome = best_chromosome(folder_path, generation, args.opponent_name)
+            if chromosome is None:
+                print("{} generation {}: no scores or winner to pick the best chromosome from".format(
+                    run_name, generation))
+                continue
+            previous = hof.run_entries(run_name)
+            rating = previous[-1]["rating"] if previous else anchor_rating
+            entry = hof.add(run_name, generation, player_name, chromosome, rating)
+            for _ in range(args.matches_per_entry):
+                hof.play_match([entry] + hof.pick_opponents(entry), args.games_per_match, args.k, args.race_mode)
+            hof.save()
+            print("{} generation {}: {:.0f}".format(run_name, generation, entry["rating"]))
+
+    for folder_path in args.paths:
+        run_name = os.path.basename(folder_path.rstrip("/"))
+        print(run_name)
+        for entry in hof.run_entries(run_name):
+            print("  generation {:>6}: {:>7.1f} ({} games)".format(entry["generation"], entry["rating"], entry["games"]))
+
+
+if __name__ == '__main__':
+    main()
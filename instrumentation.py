@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import resource
+import tracemalloc
+import multiprocessing as mp
+from collections import defaultdict
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_null_phase = _NullPhase()
+
+
+class PhaseTimer:
+    """
+    Accumulates wall time and call counts per named phase.
+    Disabled by default, in which case every hook costs a single attribute lookup.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.game_count = 0
+        self.decision_count = 0
+        self.start_time = time.perf_counter()
+
+    def reset(self):
+        self.seconds.clear()
+        self.calls.clear()
+        self.game_count = 0
+        self.decision_count = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, name, seconds, calls=1):
+        self.seconds[name] += seconds
+        self.calls[name] += calls
+
+    def phase(self, name):
+        if not self.enabled:
+            return _null_phase
+        return _Phase(self, name)
+
+    def summary(self):
+        wall_time = time.perf_counter() - self.start_time
+        phases = {}
+        for name in sorted(self.seconds, key=lambda n: -self.seconds[n]):
+            seconds = self.seconds[name]
+            phases[name] = {
+                "seconds": seconds,
+                "calls": self.calls[name],
+                "share": seconds / wall_time if wall_time > 0 else 0.,
+            }
+        return {
+            "wall_time": wall_time,
+            "games": self.game_count,
+            "decisions": self.decision_count,
+            "games_per_sec": self.game_count / wall_time if wall_time > 0 else 0.,
+            "decisions_per_sec": self.decision_count / wall_time if wall_time > 0 else 0.,
+            "phases": phases,
+        }
+
+    @staticmethod
+    def format_summary(summary):
+        lines = ["{:.2f}s, {} games ({:.1f}/s), {} decisions ({:.1f}/s)".format(
+            summary["wall_time"], summary["games"], summary["games_per_sec"],
+            summary["decisions"], summary["decisions_per_sec"]
+        )]
+        for name, phase in summary["phases"].items():
+            lines.append("  {:<32} {:>10.3f}s {:>6.1%} {:>10} calls".format(
+                name, phase["seconds"], phase["share"], phase["calls"]
+            ))
+        return "\n".join(lines)
+
+    @staticmethod
+    def write_summary(path, generation, summary):
+        with open(path, "a") as f:
+            f.write(json.dumps({"generation": generation, **summary}) + "\n")
+
+
+timer = PhaseTimer()
+
+
+def rss_bytes(pid="self"):
+    """Resident set size of a process, 0 if it can not be read."""
+    try:
+        with open("/proc/{}/statm".format(pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def worker_rss_bytes():
+    return sum(rss_bytes(child.pid) for child in mp.active_children())
+
+
+class _Subsystem:
+    def __init__(self, tracker, name):
+        self.tracker = tracker
+        self.name = name
+        self.start = 0
+        self.peak = 0
+
+    def __enter__(self):
+        self.tracker.update_peaks()
+        self.start = self.peak = tracemalloc.get_traced_memory()[0]
+        self.tracker.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.tracker.update_peaks()
+        self.tracker.stack.pop()
+        current = tracemalloc.get_traced_memory()[0]
+        self.tracker.add(self.name, self.peak - self.start, current - self.start)
+        return False
+
+
+class MemoryTracker:
+    """
+    Python heap usage per named subsystem, from tracemalloc, and process RSS.
+    For every subsystem it records the largest growth of the traced heap while it ran, and the growth it left behind.
+    Disabled by default, in which case every hook costs a single attribute lookup.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stack = []
+        self.peak = 0
+        self.peak_growth = defaultdict(int)
+        self.retained = defaultdict(int)
+        self.calls = defaultdict(int)
+
+    def start(self, frame_count=1):
+        self.enabled = True
+        tracemalloc.start(frame_count)
+        self.reset()
+
+    def reset(self):
+        self.peak_growth.clear()
+        self.retained.clear()
+        self.calls.clear()
+        if self.enabled:
+            self.peak = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+    def update_peaks(self):
+        # tracemalloc has a single peak, so it is folded into the open subsystems before it is reset
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak = max(self.peak, peak)
+        for subsystem in self.stack:
+            subsystem.peak = max(subsystem.peak, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def add(self, name, peak_growth, retained):
+        self.peak_growth[name] = max(self.peak_growth[name], peak_growth)
+        self.retained[name] += retained
+        self.calls[name] += 1
+
+    def subsystem(self, name):
+        if not self.enabled:
+            return _null_phase
+        return _Subsystem(self, name)
+
+    def summary(self):
+        summary = {"rss": rss_bytes(), "rss_peak": peak_rss_bytes(), "worker_rss": worker_rss_bytes()}
+        if self.enabled:
+            self.update_peaks()
+            summary["traced"] = tracemalloc.get_traced_memory()[0]
+            summary["traced_peak"] = self.peak
+            summary["subsystems"] = {name: {"peak_growth": self.peak_growth[name], "retained": self.retained[name],
+                                            "calls": self.calls[name]}
+                                     for name in sorted(self.peak_growth, key=lambda n: -self.peak_growth[n])}
+        return summary
+
+    @staticmethod
+    def format_summary(summary):
+        mb = 1 / 2 ** 20
+        line = "rss {:.1f} MB (peak {:.1f} MB), workers {:.1f} MB".format(
+            summary["rss"] * mb, summary["rss_peak"] * mb, summary["worker_rss"] * mb)
+        if "traced" not in summary:
+            return line
+        lines = [line + ", traced {:.1f} MB (peak {:.1f} MB)".format(
+            summary["traced"] * mb, summary["traced_peak"] * mb)]
+        for name, subsystem in summary["subsystems"].items():
+            lines.append("  {:<32} peak +{:>9.2f} MB retained {:>+9.2f} MB {:>10} calls".format(
+                name, subsystem["peak_growth"] * mb, subsystem["retained"] * mb, subsystem["calls"]))
+        return "\n".join(lines)
+
+    @staticmethod
+    def write_summary(path, generation, summary):
+        PhaseTimer.write_summary(path, generation, summary)
+
+
+memory = MemoryTracker()
@@ -0,0 +1,94 @@
+"""
+Single entry point for the scripts, e.g.
+
+    python ludo.py run_ga --player simple ...
+    python ludo.py eval_population --path populations ...
+
+Only the module of the chosen command is imported, so short lived processes do not pay for numpy, matplotlib,
+watchdog and pyludo unless they use them.
+"""
+import sys
+import importlib
+
+commands = {
+    "run_ga": "train a population",
+    "eval_population": "watch a folder and score new populations against a fixed opponent",
+    "eval_agent": "play a chromosome against a fixed player or another chromosome",
+    "reduce_population": "reduce a population to its best chromosomes by tournaments",
+    "plot_score": "plot evaluation scores of runs",
+    "plot_genes": "plot the genes of a run",
+    "sweep": "run a grid of configurations on a core budget",
+    "benchmark": "time-to-target benchmark of configurations",
+    "hall_of_fame": "rate the best chromosomes of runs by Elo",
+    "replay": "rescore recorded games offline",
+    "distributed": "run a worker for a remote run_ga coordinator",
+    "startup_check": "check the startup time of this entry point",
+}
+
+heavy_modules = ["numpy", "matplotlib", "watchdog", "progressbar", "pyludo"]
+max_overhead = 0.02  # seconds the entry point may add to a bare interpreter start
+
+
+def usage():
+    width = max(len(command) for command in commands)
+    lines = ["usage: ludo.py <command> [args]", "", "commands:"]
+    lines += ["  {}  {}".format(command.ljust(width), description) for command, description in commands.items()]
+    return "\n".join(lines)
+
+
+def measure(command, repeats):
+    import time
+    import subprocess
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2]
+
+
+def startup_check(args):
+    import argparse
+    import subprocess
+    parser = argparse.ArgumentParser(prog="ludo.py startup_check")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--max_overhead", type=float, default=max_overhead,
+                        help="max seconds the entry point may add to a bare interpreter start, median of the repeats")
+    args = parser.parse_args(args)
+
+    check = "import sys, ludo; print(','.join(m for m in ludo.heavy_modules if m in sys.modules))"
+    imported = subprocess.run([sys.executable, "-c", check], stdout=subprocess.PIPE, check=True,
+                              universal_newlines=True).stdout.strip()
+    baseline = measure([sys.executable, "-c", "pass"], args.repeats)
+    entry = measure([sys.executable, __file__, "--help"], args.repeats)
+    overhead = entry - baseline
+    print("interpreter {:.1f} ms, ludo.py --help {:.1f} ms, overhead {:.1f} ms (max {:.1f} ms)".format(
+        baseline * 1e3, entry * 1e3, overhead * 1e3, args.max_overhead * 1e3))
+    failed = False
+    if imported:
+        print("heavy modules imported at startup: " + imported)
+        failed = True
+    if overhead > args.max_overhead:
+        print("startup overhead above the target")
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    command, args = argv[0], argv[1:]
+    if command not in commands:
+        print("unknown command '{}'\n\n{}".format(command, usage()), file=sys.stderr)
+        return 2
+    if command == "startup_check":
+        return startup_check(args)
+    module = importlib.import_module(command)
+    sys.argv = ["ludo.py " + command] + args
+    return module.main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
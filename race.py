@@ -0,0 +1,149 @@
+"""
+Exact win probabilities for the race phase of a game.
+
+Once every token that is not in goal is on its player's home stretch, the players can no longer interact,
+and each player only needs the number of own turns it takes to bring its remaining tokens to goal.
+The table holds, for every home stretch configuration of a player, the distribution of that number,
+assuming the player moves the token that minimizes the expected number of remaining turns.
+Games are only ended early once every player has at most one token left outside goal, as its moves are forced
+from then on and the distribution no longer depends on how the players choose.
+"""
+import os
+import random
+import itertools
+
+import numpy as np
+
+from pyludo import LudoState
+
+GOAL = 99
+MAX_TURNS = 400
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "race_table.npz")
+
+
+def is_race_state(state):
+    for player_id in range(4):
+        remaining = 0
+        for token in state[player_id]:
+            if token <= 51:
+                return False
+            if token != GOAL:
+                remaining += 1
+        if remaining > 1:
+            return False
+    return True
+
+
+def _move(row, token_id, dice_roll):
+    state = LudoState(np.array([row] + [[GOAL] * 4] * 3))
+    next_state = state.move_token(token_id, dice_roll)
+    if next_state is False:
+        return None
+    return tuple(sorted(int(token) for token in next_state[0]))
+
+
+def _stretch_positions():
+    # home stretch positions are found through the engine's own move rules, starting from the end of the board
+    positions = set()
+    frontier = set()
+    for start in range(40, 52):
+        for dice_roll in range(1, 7):
+            row = _move((start, GOAL, GOAL, GOAL), 0, dice_roll)
+            if row is not None and 51 < row[0] < GOAL:
+                frontier.add(row[0])
+    while frontier:
+        position = frontier.pop()
+        positions.add(position)
+        for dice_roll in range(1, 7):
+            row = _move((position, GOAL, GOAL, GOAL), 0, dice_roll)
+            if row is not None and 51 < row[0] < GOAL and row[0] not in positions:
+                frontier.add(row[0])
+    return sorted(positions)
+
+
+class RaceTable:
+    def __init__(self, rows, cdf):
+        self.rows = rows
+        self.cdf = cdf  # cdf[s, t] = P(row s has all tokens in goal after t own turns)
+        self.row_index = {tuple(row): i for i, row in enumerate(rows.tolist())}
+        self.pmf = np.diff(cdf, axis=1, prepend=0.)
+
+    @classmethod
+    def build(cls, max_turns=MAX_TURNS):
+        positions = _stretch_positions() + [GOAL]
+        rows = list(itertools.combinations_with_replacement(positions, 4))
+        row_index = {row: i for i, row in enumerate(rows)}
+        goal_id = row_index[(GOAL,) * 4]
+
+        # candidate next rows for every row and dice roll, identical tokens are only tried once
+        candidates = [[
+            sorted({row_index[next_row] for token_id in range(4) if row[token_id] != GOAL
+                    for next_row in [_move(row, token_id, dice_roll)] if next_row is not None}) or [i]
+            for dice_roll in range(1, 7)
+        ] for i, row in enumerate(rows)]
+
+        # expected remaining turns by value iteration, the bounce back at the end of the stretch makes it cyclic
+        expected = np.zeros(len(rows))
+        while True:
+            new_expected = np.array([
+                0. if i == goal_id else 1 + np.mean([expected[c].min() for c in candidates[i]])
+                for i in range(len(rows))
+            ])
+            converged = np.abs(new_expected - expected).max() < 1e-10
+            expected = new_expected
+            if converged:
+                break
+
+        next_ids = np.array([[c[int(np.argmin(expected[c]))] for c in candidates[i]] for i in range(len(rows))])
+        next_ids[goal_id] = goal_id
+        cdf = np.zeros((len(rows), max_turns + 1))
+        cdf[goal_id, 0] = 1
+        for t in range(1, max_turns + 1):
+            cdf[:, t] = cdf[next_ids, t - 1].mean(axis=1)
+        return cls(np.array(rows), cdf)
+
+    @classmethod
+    def load(cls, path=default_path):
+        if os.path.exists(path):
+            data = np.load(path)
+            return cls(data["rows"], data["cdf"])
+        table = cls.build()
+        # workers may build the table at the same time, so each writes its own file and renames it into place
+        writing_path = "{}.writing-{}.npz".format(path[:-len(".npz")], os.getpid())
+        np.savez(writing_path, rows=table.rows, cdf=table.cdf)
+        os.rename(writing_path, path)
+        return table
+
+    def row_id(self, tokens):
+        return self.row_index[tuple(sorted(int(token) for token in tokens))]
+
+    def win_probabilities(self, state, current_player):
+        """Win probability of every player, with current_player to move next."""
+        order = [(current_player + k) % 4 for k in range(4)]
+        pmf = self.pmf[[self.row_id(state[player_id]) for player_id in order]]
+        survival = 1 - np.cumsum(pmf, axis=1)  # P(T > t)
+        survival_before = np.concatenate((np.ones((4, 1)), survival[:, :-1]), axis=1)  # P(T > t - 1)
+        probs = np.empty(4)
+        for k in range(4):
+            # players earlier in the turn order win ties in turn count
+            others = np.prod(survival[:k], axis=0) * np.prod(survival_before[k + 1:], axis=0)
+            probs[order[k]] = np.sum(pmf[k] * others)
+        return probs / probs.sum()
+
+    def sample_winner(self, state, current_player):
+        order = [(current_player + k) % 4 for k in range(4)]
+        # python's random is reseeded in forked workers, numpy's global generator is not
+        turns = [int(np.searchsorted(self.cdf[self.row_id(state[player_id])], random.random()))
+                 for player_id in order]
+        # player k in the turn order finishes in round turns[k] - 1, ties go to the earlier player
+        return order[int(np.argmin([(t - 1) * 4 + k for k, t in enumerate(turns)]))]
+
+
+_table = None
+
+
+def get_race_table():
+    global _table
+    if _table is None:
+        _table = RaceTable.load()
+    return _table
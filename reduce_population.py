@@ -6,6 +6,7 @@ import numpy as np
 
 from pyludo import LudoGame, LudoPlayerRandom
 from GAPlayers import get_ga_player
+from chromosome_store import load_population
 
 
 def tournament(chromosomes, Player, game_count):
@@ -52,7 +53,7 @@ def main():
     player_name = folder_name.split("+")[0]
     Player = get_ga_player(player_name)
 
-    population = list(np.load(args.population_path))
+    population = list(load_population(args.population_path))
     N = len(population)
     required_tournament_count = get_required_tournament_count(N)
     required_game_count = required_tournament_count * args.games_per_tournament
@@ -0,0 +1,106 @@
+"""
+Offline replay of recorded decisions.
+
+Every recorded decision is rescored by the given chromosomes without playing games, to measure decisions per second
+and how often the chromosomes choose the recorded move, or the same move as each other.
+Two moves are the same if they lead to the same state up to the order of a player's tokens.
+"""
+import time
+import argparse
+from glob import glob
+
+import numpy as np
+
+from GAPlayers import get_ga_player
+from compact_board import MoveBuffer
+from game_records import load_records, ILLEGAL
+from chromosome_store import load_chromosome
+
+
+def load_player(spec):
+    # name:path[:row], path being a single chromosome or a population
+    name, path, *row = spec.split(":")
+    chromosome = load_chromosome(path, int(row[0]) if row else 0)
+    return get_ga_player(name)(chromosome.astype(np.float64))
+
+
+def choose_batch(player, records):
+    """The action of the player for each of the records."""
+    candidates = records["next_states"]
+    legal = candidates[:, :, 0, 0] != ILLEGAL
+    if player.features_batch is not None:
+        action_ids = np.broadcast_to(np.arange(4), (len(records), 4))
+        scores = player.score_features(player.features_batch(records["state"], candidates, action_ids))
+    else:
+        moves = MoveBuffer()
+        scores = np.empty((len(records), 4))
+        for i, record in enumerate(records):
+            scores[i] = player.eval_moves(moves.load_packed(record["state"], record["next_states"], legal[i]))
+    scores = np.where(legal, scores, -np.inf)
+    return np.argmax(scores, axis=1)
+
+
+def chosen_canonical(records, actions):
+    chosen = records["next_states"][np.arange(len(records)), actions]
+    return np.sort(chosen, axis=2).reshape((len(records), -1))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logs", nargs='+', required=True, help="record files, or directories of record files")
+    parser.add_argument("--players", nargs='+', required=True, help="name:path[:row]")
+    parser.add_argument("--batch_size", type=int, default=4096)
+    parser.add_argument("--only_player", type=str, help="only replay the decisions of this recorded player")
+    parser.add_argument("--max_records", type=int)
+    args = parser.parse_args()
+
+    log_paths = []
+    for path in args.logs:
+        log_paths += sorted(glob(path + "/*.rec")) if not path.endswith(".rec") else [path]
+    players = [load_player(spec) for spec in args.players]
+
+    n = len(players)
+    seconds = np.zeros(n)
+    recorded_agreement = np.zeros(n)
+    pairwise_agreement = np.zeros((n, n))
+    record_count = 0
+    for log_path in log_paths:
+        records, player_names = load_records(log_path)
+        if args.only_player is not None:
+            if args.only_player not in player_names:
+                continue
+            records = records[records["player"] == player_names.index(args.only_player)]
+        for start in range(0, len(records), args.batch_size):
+            if args.max_records is not None:
+                if record_count >= args.max_records:
+                    break
+                batch = np.array(records[start:start + min(args.batch_size, args.max_records - record_count)])
+            else:
+                batch = np.array(records[start:start + args.batch_size])
+            recorded = chosen_canonical(batch, batch["action"].astype(np.intp))
+            chosen = []
+            for i, player in enumerate(players):
+                batch_start = time.perf_counter()
+                actions = choose_batch(player, batch)
+                seconds[i] += time.perf_counter() - batch_start
+                chosen.append(chosen_canonical(batch, actions))
+                recorded_agreement[i] += np.all(chosen[i] == recorded, axis=1).sum()
+            for i in range(n):
+                for j in range(i + 1, n):
+                    pairwise_agreement[i, j] += np.all(chosen[i] == chosen[j], axis=1).sum()
+            record_count += len(batch)
+
+    if record_count == 0:
+        print("no records to replay")
+        return
+    print("replayed {} decisions from {} logs".format(record_count, len(log_paths)))
+    for i, spec in enumerate(args.players):
+        print("{:>3} {}: {:.0f} decisions/s, {:.3f} agreement with the recorded moves".format(
+            i, spec, record_count / max(seconds[i], 1e-9), recorded_agreement[i] / record_count))
+    for i in range(n):
+        for j in range(i + 1, n):
+            print("agreement {} - {}: {:.3f}".format(i, j, pairwise_agreement[i, j] / record_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+The component arguments of run_ga, as given on the command line, and the run folder names derived from them.
+"""
+from GAPlayers import get_ga_player
+from Selections import get_selection
+from Recombinators import get_recombinator
+from Mutators import get_mutator
+
+
+def parse_args(args, required_args):
+    assert len(args) == len(required_args), 'expexted args: {}'.format(required_args)
+    parsed_args = []
+    str_args = []
+    for arg_i, (arg_name, typ) in enumerate(required_args):
+        provided_arg_name, val = args[arg_i].split("=")
+        assert provided_arg_name == arg_name, 'expected "{}", got "{}"'.format(arg_name, provided_arg_name)
+        parsed_args.append(typ(val))
+        str_args.append(val)
+    return parsed_args, str_args
+
+
+def args_str_to_string(args_str):
+    if args_str:
+        return "-" + "-".join(args_str)
+    return ""
+
+
+def get_folder_name(player, selection, recombination, mutation):
+    # arguments are the lists passed to --player, --selection, --recombination and --mutation
+    parts = []
+    for get_class, cli_args in ((get_ga_player, player), (get_selection, selection),
+                                (get_recombinator, recombination), (get_mutator, mutation)):
+        Class = get_class(cli_args[0])
+        _, args_str = parse_args(cli_args[1:], Class.args)
+        parts.append(Class.name + args_str_to_string(args_str))
+    return "+".join(parts)
@@ -1,8 +1,9 @@
 import os
+import sys
+import time
+import random
 import argparse
-import glob
 import functools
-import sys
 
 import numpy as np
 
@@ -10,31 +11,34 @@ from Selections import get_selection
 from Recombinators import get_recombinator
 from Mutators import get_mutator
 from GAPlayers import get_ga_player
-
-
-def parse_args(args, required_args):
-    assert len(args) == len(required_args), 'expexted args: {}'.format(required_args)
-    parsed_args = []
-    str_args = []
-    for arg_i, (arg_name, typ) in enumerate(required_args):
-        provided_arg_name, val = args[arg_i].split("=")
-        assert provided_arg_name == arg_name, 'expected "{}", got "{}"'.format(arg_name, provided_arg_name)
-        parsed_args.append(typ(val))
-        str_args.append(val)
-    return parsed_args, str_args
-
-
-def args_str_to_string(args_str):
-    if args_str:
-        return "-" + "-".join(args_str)
-    return ""
-
-
-def save(folder_path, gen_id, population):
-    file_writing_name = folder_path + "/{}.pop.writing.npy".format(gen_id)
-    file_written_name = folder_path + "/{}.pop.npy".format(gen_id)
-    np.save(file_writing_name, population)
-    os.rename(file_writing_name, file_written_name)
+from Surrogates import get_surrogate
+from instrumentation import timer, memory
+from telemetry import TelemetryWriter, read_telemetry
+from distributed import Coordinator, parse_address
+from game_jobs import PoolRunner
+from scheduler import ScheduledRunner
+from run_config import parse_args, get_folder_name
+from chromosome_store import ChromosomeStore, get_generation_ids, get_population_path, load_population
+
+
+def get_state_path(folder_path, gen_id):
+    return folder_path + "/{}.state.npz".format(gen_id)
+
+
+def save(folder_path, gen_id, selection, store=None):
+    # the selection state is written first, so a visible population always has its state
+    state = selection.get_state()
+    with timer.phase("save"), memory.subsystem("save"):
+        if state is not None:
+            state_writing_name = folder_path + "/{}.state.writing.npz".format(gen_id)
+            np.savez(state_writing_name, **state)
+            os.rename(state_writing_name, get_state_path(folder_path, gen_id))
+        if store is not None:
+            store.save_population(folder_path + "/{}.popref.npy".format(gen_id), selection.get_flat_pop())
+            return
+        file_writing_name = folder_path + "/{}.pop.writing.npy".format(gen_id)
+        np.save(file_writing_name, selection.get_flat_pop())
+        os.rename(file_writing_name, folder_path + "/{}.pop.npy".format(gen_id))
 
 
 def main():
@@ -46,20 +50,58 @@ def main():
     parser.add_argument("--gen_count", type=int, required=True)
     parser.add_argument("--save_nth_gen", type=int, required=True)
     parser.add_argument("--cont", action="store_const", const=True, default=False)
+    parser.add_argument("--timing", action="store_const", const=True, default=False,
+                        help="time the phases of every generation, with games played in the main process only")
+    parser.add_argument("--gene_stats", action="store_const", const=True, default=False)
+    parser.add_argument("--process_count", type=int, default=1, help="local processes to play game jobs on")
+    parser.add_argument("--coordinator", type=str, help="host:port to serve tournament jobs to remote workers on")
+    parser.add_argument("--job_timeout", type=float)
+    parser.add_argument("--scheduler", action="store_const", const=True, default=False,
+                        help="split game jobs into chunks by their learned cost and balance them over the processes")
+    parser.add_argument("--fitness_inheritance", action="store_const", const=True, default=False,
+                        help="rank tournament players by their accumulated games since they were created")
+    parser.add_argument("--fitness_history_cap", type=int, default=0,
+                        help="max number of past games a chromosome's history counts as")
+    parser.add_argument("--record_dir", type=str, help="record every decision of the tournament games here")
+    parser.add_argument("--surrogate", nargs='+',
+                        help="model that pre-screens extra candidate children before they play")
+    parser.add_argument("--race_mode", choices=["sample", "credit"],
+                        help="end games early once they are a pure dice race")
+    parser.add_argument("--dedup_storage", action="store_const", const=True, default=False,
+                        help="store every distinct chromosome once and generations as references to them")
+    parser.add_argument("--seed", type=int,
+                        help="seed of the main process, game jobs on other processes are not seeded")
+    parser.add_argument("--time_budget", type=float, help="stop after the generation that exceeds this many seconds")
+    parser.add_argument("--out_dir", type=str, default="populations")
+    parser.add_argument("--memory", action="store_const", const=True, default=False,
+                        help="track memory per generation and subsystem with tracemalloc, slows down the run")
+    parser.add_argument("--memory_budget", type=float,
+                        help="MB of RSS, including worker processes, above which the run saves and exits")
     args = parser.parse_args()
 
+    # the phases of games played on other processes are not collected
+    assert not (args.timing and (args.coordinator or args.scheduler or args.process_count > 1)), \
+        "--timing only measures runs that play their games in the main process"
+    timer.enabled = args.timing
+    if args.memory:
+        memory.start()
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    start_time = time.time()
+
     Player = get_ga_player(args.player[0])
-    player_args, player_args_str = parse_args(args.player[1:], Player.args)
+    player_args, _ = parse_args(args.player[1:], Player.args)
     gene_count = Player.gene_count
 
     Selection = get_selection(args.selection[0])
-    selection_args, selection_args_str = parse_args(args.selection[1:], Selection.args)
+    selection_args, _ = parse_args(args.selection[1:], Selection.args)
 
     Recombinator = get_recombinator(args.recombination[0])
-    recombinator_args, recombinator_args_str = parse_args(args.recombination[1:], Recombinator.args)
+    recombinator_args, _ = parse_args(args.recombination[1:], Recombinator.args)
 
     Mutator = get_mutator(args.mutation[0])
-    mutator_args, mutator_args_str = parse_args(args.mutation[1:], Mutator.args)
+    mutator_args, _ = parse_args(args.mutation[1:], Mutator.args)
 
     mutator = Mutator(gene_count, *mutator_args)
     recombinator = Recombinator(gene_count, *recombinator_args)
@@ -69,40 +111,100 @@ def main():
 
     pop_init = functools.partial(Player.pop_init, Player, mutator.chromosome_length - Player.gene_count)
     selection = Selection(Player, pop_init, recombinator, mutator, *selection_args)
-
-    folder_name = "{}{}+{}{}+{}{}+{}{}".format(
-        Player.name, args_str_to_string(player_args_str),
-        Selection.name, args_str_to_string(selection_args_str),
-        Recombinator.name, args_str_to_string(recombinator_args_str),
-        Mutator.name, args_str_to_string(mutator_args_str),
-    )
-    folder_path = "populations/" + folder_name
+    selection.race_mode = args.race_mode
+    selection.record_dir = args.record_dir
+    selection.fitness_inheritance = args.fitness_inheritance
+    selection.fitness_history_cap = args.fitness_history_cap
+    if args.surrogate:
+        Surrogate = get_surrogate(args.surrogate[0])
+        surrogate_args, _ = parse_args(args.surrogate[1:], Surrogate.args)
+        selection.surrogate = Surrogate(gene_count, *surrogate_args)
+    if args.coordinator:
+        selection.runner = Coordinator(*parse_address(args.coordinator), job_timeout=args.job_timeout)
+    elif args.scheduler:
+        selection.runner = ScheduledRunner(args.process_count, args.out_dir + "/job_costs.json")
+    elif args.process_count > 1:
+        selection.runner = PoolRunner(args.process_count)
+
+    folder_name = get_folder_name(args.player, args.selection, args.recombination, args.mutation)
+    folder_path = args.out_dir + "/" + folder_name
 
     assert os.path.isdir(folder_path) == args.cont, '{} should{} exist'.format(folder_path, '' if args.cont else ' not')
     if not args.cont:
-        os.mkdir(folder_path)
+        os.makedirs(folder_path)
     else:
-        gen_ids = [int(os.path.basename(path).split(".")[0]) for path in glob.glob(folder_path + "/*.pop.npy")]
-        selection.current_generation = max(gen_ids)
-        selection.population = np.load(folder_path + "/{}.pop.npy".format(selection.current_generation))
+        selection.current_generation = max(get_generation_ids(folder_path))
+        population_path = get_population_path(folder_path, selection.current_generation)
+        selection.load_population(load_population(population_path))
+        state_path = get_state_path(folder_path, selection.current_generation)
+        if os.path.exists(state_path):
+            with np.load(state_path) as state:
+                selection.set_state(dict(state))
+        if selection.surrogate is not None:
+            pair_count = selection.surrogate.warm_start(folder_path)
+            print("surrogate warm started with {} scored chromosomes".format(pair_count))
+        # the run may have got past its last save, so the telemetry of the saved generation is continued
+        resumed_record = None
+        if os.path.exists(folder_path + "/telemetry.jsonl"):
+            for record in read_telemetry(folder_path + "/telemetry.jsonl"):
+                if record["generation"] == selection.current_generation:
+                    resumed_record = record
+            if resumed_record is not None:
+                selection.total_game_count = resumed_record["total_game_count"]
+
+    store = ChromosomeStore(folder_path) if args.dedup_storage else None
 
     if generation_count == 0:
         generation_count = int(1e9)
 
+    exit_code = 0
     if not args.cont:
-        save(folder_path, 0, selection.get_flat_pop())
+        save(folder_path, 0, selection, store)
+    if args.cont and resumed_record is not None:
+        telemetry = TelemetryWriter(folder_path + "/telemetry.jsonl", gene_count, args.gene_stats,
+                                    resumed_record["wall_time"], selection.total_game_count)
+    else:
+        telemetry = TelemetryWriter(folder_path + "/telemetry.jsonl", gene_count, args.gene_stats)
+        telemetry.write(selection)
+    timer.reset()
+    memory.reset()
     for i in range(selection.current_generation, generation_count):
-        selection.step()
+        with memory.subsystem("selection"):
+            selection.step()
         if selection.current_generation % save_every_nth_generation == 0:
-            save(folder_path, selection.current_generation, selection.get_flat_pop())
-        flat_pop = selection.get_flat_pop()
-        chromo_mean = flat_pop.mean(axis=0)
-        chromo_std = flat_pop.std(axis=0)
-        print("gene mean", chromo_mean[:gene_count])
-        print("gene std ", chromo_std[:gene_count])
-        print("sigma mean", chromo_mean[gene_count:])
-        print("sigma std ", chromo_std[gene_count:])
-        print(*sys.argv[1:])
+            save(folder_path, selection.current_generation, selection, store)
+        with memory.subsystem("telemetry"):
+            record = telemetry.write(selection)
+        print("generation {}, {} games, {:.1f} games/s, gene std {:.4f}{}".format(
+            record["generation"], record["total_game_count"], record["games_per_sec"], record["gene_std"],
+            ", worker utilization {:.1%}".format(record["worker_utilization"]) if "worker_utilization" in record else ""
+        ))
+        if timer.enabled:
+            summary = timer.summary()
+            print(timer.format_summary(summary))
+            timer.write_summary(folder_path + "/timings.jsonl", selection.current_generation, summary)
+            timer.reset()
+        stop_reason = None
+        if args.memory or args.memory_budget is not None:
+            summary = memory.summary()
+            if args.memory:
+                print(memory.format_summary(summary))
+                memory.write_summary(folder_path + "/memory.jsonl", selection.current_generation, summary)
+                memory.reset()
+            rss_mb = (summary["rss"] + summary["worker_rss"]) / 2 ** 20
+            if args.memory_budget is not None and rss_mb > args.memory_budget:
+                stop_reason = "memory budget of {} MB exceeded: {:.1f} MB".format(args.memory_budget, rss_mb)
+                exit_code = 3
+        if stop_reason is None and args.time_budget is not None and time.time() - start_time > args.time_budget:
+            stop_reason = "time budget of {}s used up".format(args.time_budget)
+        if stop_reason is not None:
+            # a checkpoint to continue from with --cont
+            if selection.current_generation % save_every_nth_generation != 0:
+                save(folder_path, selection.current_generation, selection, store)
+            print(stop_reason)
+            break
+    return exit_code
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Cost-aware scheduling of game jobs on local worker processes.
+
+The cost per game of every job configuration (player, chromosome count, opponents, race mode) is learned from the
+timings of finished chunks, and kept in a json file across runs. Jobs are split into chunks of about the same expected
+duration and spread over one queue per worker, longest first. A worker whose queue runs empty steals the later half
+of the queue with the most expected work left, splitting its last chunk if needed, so all workers stay busy until the
+end of the batch.
+"""
+import os
+import json
+import time
+import queue
+import multiprocessing as mp
+from collections import deque
+
+import numpy as np
+
+from game_jobs import GameJob, play_job
+
+
+def job_key(job: GameJob):
+    opponent_names = job.opponent_name if isinstance(job.opponent_name, list) else [job.opponent_name]
+    return "{}x{}|{}|{}".format(job.player_name, len(job.chromosomes), ",".join(map(str, opponent_names)),
+                                job.race_mode)
+
+
+def schedule_worker(task_queue: mp.Queue, result_queue: mp.Queue, worker_id):
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        chunk_id, job = task
+        start = time.perf_counter()
+        win_counts = play_job(job)
+        result_queue.put((worker_id, chunk_id, win_counts, time.perf_counter() - start))
+
+
+class CostModel:
+    """Seconds per game of each job configuration, as an exponential moving average of the measured chunks."""
+
+    def __init__(self, path=None, default_cost=0.05, smoothing=0.2):
+        self.path = path
+        self.default_cost = default_cost
+        self.smoothing = smoothing
+        self.costs = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.costs = json.load(f)
+
+    def cost(self, key):
+        if key in self.costs:
+            return self.costs[key]
+        return float(np.median(list(self.costs.values()))) if self.costs else self.default_cost
+
+    def update(self, key, seconds_per_game):
+        old = self.costs.get(key)
+        self.costs[key] = seconds_per_game if old is None else old + self.smoothing * (seconds_per_game - old)
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path + ".writing", "w") as f:
+            json.dump(self.costs, f, indent=1)
+        os.rename(self.path + ".writing", self.path)
+
+
+class ScheduledRunner:
+    name = "scheduled"
+
+    def __init__(self, process_count, cost_path=None, chunks_per_worker=4, min_chunk_seconds=0.5, prefetch=2):
+        self.process_count = process_count
+        self.costs = CostModel(cost_path)
+        self.chunks_per_worker = chunks_per_worker
+        self.min_chunk_seconds = min_chunk_seconds
+        self.prefetch = prefetch
+        self.busy_seconds = 0.
+        self.capacity_seconds = 0.
+        self.result_queue = mp.Queue()
+        self.task_queues = [mp.Queue() for _ in range(process_count)]
+        self.workers = [mp.Process(target=schedule_worker, args=(task_queue, self.result_queue, worker_id),
+                                   daemon=True) for worker_id, task_queue in enumerate(self.task_queues)]
+        for worker in self.workers:
+            worker.start()
+
+    def split(self, jobs, costs):
+        # chunks of a share of the expected batch duration per worker, but not so short that overhead dominates
+        total = sum(job.game_count * cost for job, cost in zip(jobs, costs))
+        target = max(self.min_chunk_seconds, total / (self.process_count * self.chunks_per_worker))
+        chunks = []
+        for job_id, (job, cost) in enumerate(zip(jobs, costs)):
+            if job.game_count == 0:
+                continue
+            chunk_count = max(1, min(job.game_count, int(round(job.game_count * cost / target))))
+            bounds = np.linspace(0, job.game_count, chunk_count + 1).round().astype(int)
+            chunks += [[job_id, int(game_count), cost] for game_count in np.diff(bounds)]
+        return chunks
+
+    def distribute(self, chunks):
+        # longest expected chunk first, onto the queue with the least expected work
+        queues = [deque() for _ in range(self.process_count)]
+        loads = np.zeros(self.process_count)
+        for chunk in sorted(chunks, key=lambda chunk: -chunk[1] * chunk[2]):
+            worker_id = int(np.argmin(loads))
+            queues[worker_id].append(chunk)
+            loads[worker_id] += chunk[1] * chunk[2]
+        return queues
+
+    @staticmethod
+    def steal(queues, thief_id):
+        victim = max(queues, key=lambda q: sum(chunk[1] * chunk[2] for chunk in q))
+        if not victim:
+            return False
+        if len(victim) == 1 and victim[0][1] > 1:
+            job_id, game_count, cost = victim[0]
+            victim[0] = [job_id, game_count - game_count // 2, cost]
+            queues[thief_id].append([job_id, game_count // 2, cost])
+        else:
+            for _ in range(max(1, len(victim) // 2)):
+                queues[thief_id].appendleft(victim.pop())
+        return True
+
+    def get_result(self):
+        while True:
+            try:
+                return self.result_queue.get(timeout=5)
+            except queue.Empty:
+                for worker in self.workers:
+                    if not worker.is_alive():
+                        raise RuntimeError("scheduler worker died with exit code {}".format(worker.exitcode))
+
+    def run(self, jobs):
+        """Results in job order, each yielded as soon as all games of the job and the jobs before it are played."""
+        jobs = list(jobs)
+        keys = [job_key(job) for job in jobs]
+        queues = self.distribute(self.split(jobs, [self.costs.cost(key) for key in keys]))
+        win_counts = [np.zeros(len(job.chromosomes)) for job in jobs]
+        pending_games = [job.game_count for job in jobs]
+        remaining_games = sum(pending_games)
+        in_flight = {}
+        outstanding = [0] * self.process_count
+        next_chunk_id = 0
+        busy_seconds = 0.
+        start = time.perf_counter()
+
+        def dispatch(worker_id):
+            nonlocal next_chunk_id
+            while outstanding[worker_id] < self.prefetch and (queues[worker_id] or self.steal(queues, worker_id)):
+                job_id, game_count, _ = queues[worker_id].popleft()
+                job = jobs[job_id]
+                chunk = GameJob(job.player_name, job.chromosomes, game_count, job.opponent_name, job.race_mode,
+                                job.record_dir)
+                in_flight[next_chunk_id] = job_id, game_count
+                self.task_queues[worker_id].put((next_chunk_id, chunk))
+                next_chunk_id += 1
+                outstanding[worker_id] += 1
+
+        for worker_id in range(self.process_count):
+            dispatch(worker_id)
+        next_job_id = 0
+        while next_job_id < len(jobs):
+            if pending_games[next_job_id] > 0:
+                worker_id, chunk_id, chunk_win_counts, seconds = self.get_result()
+                job_id, game_count = in_flight.pop(chunk_id)
+                outstanding[worker_id] -= 1
+                dispatch(worker_id)
+                win_counts[job_id] += chunk_win_counts
+                pending_games[job_id] -= game_count
+                remaining_games -= game_count
+                busy_seconds += seconds
+                self.costs.update(keys[job_id], seconds / game_count)
+                if remaining_games == 0:
+                    # callers stop after the last result, so nothing after the final yield runs
+                    self.busy_seconds += busy_seconds
+                    self.capacity_seconds += (time.perf_counter() - start) * self.process_count
+                    self.costs.save()
+            while next_job_id < len(jobs) and pending_games[next_job_id] == 0:
+                yield win_counts[next_job_id]
+                next_job_id += 1
+
+    def utilization(self, reset=True):
+        """Share of the worker time spent playing games since the last reset."""
+        utilization = self.busy_seconds / self.capacity_seconds if self.capacity_seconds > 0 else 0.
+        if reset:
+            self.busy_seconds = self.capacity_seconds = 0.
+        return utilization
+
+    def close(self):
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for worker in self.workers:
+            worker.join()
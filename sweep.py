@@ -0,0 +1,231 @@
+"""
+Runs a grid of run_ga configurations on a fixed core budget.
+Unfinished runs are resumed with --cont, and runs whose evaluation scores are clearly dominated are stopped.
+
+A grid spec is a json file like
+
+{
+    "player": ["simple", "advanced"],
+    "selection": {"tournament": {"population_size": 100, "games_per_tournament": [10, 20]}},
+    "recombination": ["none", {"blend": {"alpha": [0.1, 0.5]}}],
+    "mutation": {"one_step": {"lr": [0.5, 1.0]}},
+    "gen_count": 200,
+    "save_nth_gen": 10
+}
+
+where every component is a name, a {name: {arg: value or [values]}} dict, or a list of those.
+"""
+import os
+import sys
+import json
+import shutil
+import time
+import itertools
+import argparse
+import subprocess
+
+import numpy as np
+
+from Selections import get_selection
+from Recombinators import get_recombinator
+from Mutators import get_mutator
+from GAPlayers import get_ga_player
+from ga_utils import load_opponent_scores
+from run_config import get_folder_name
+from chromosome_store import get_generation_ids
+
+
+def expand_component(spec, get_class):
+    if isinstance(spec, list):
+        return [arg_list for sub_spec in spec for arg_list in expand_component(sub_spec, get_class)]
+    if isinstance(spec, str):
+        spec = {spec: {}}
+    arg_lists = []
+    for name, arg_values in spec.items():
+        Class = get_class(name)
+        mismatch = {arg_name for arg_name, _ in Class.args} ^ set(arg_values)
+        assert not mismatch, '{}: expected args {}, got {}'.format(name, Class.args, list(arg_values))
+        value_lists = [arg_values[arg_name] if isinstance(arg_values[arg_name], list) else [arg_values[arg_name]]
+                       for arg_name, _ in Class.args]
+        for values in itertools.product(*value_lists):
+            arg_lists.append([name] + ["{}={}".format(arg_name, value)
+                                       for (arg_name, _), value in zip(Class.args, values)])
+    return arg_lists
+
+
+def expand_grid(grid):
+    components = [
+        expand_component(grid["player"], get_ga_player),
+        expand_component(grid["selection"], get_selection),
+        expand_component(grid["recombination"], get_recombinator),
+        expand_component(grid["mutation"], get_mutator),
+    ]
+    return [list(config) for config in itertools.product(*components)]
+
+
+class SweepRun:
+    def __init__(self, config, gen_count, save_nth_gen):
+        self.config = config
+        self.gen_count = gen_count
+        self.save_nth_gen = save_nth_gen
+        self.folder_name = get_folder_name(*config)
+        self.folder_path = "populations/" + self.folder_name
+        self.process = None
+        self.log_file = None
+
+    def last_generation(self):
+        if not os.path.isdir(self.folder_path):
+            return None
+        gen_ids = get_generation_ids(self.folder_path)
+        return max(gen_ids) if gen_ids else None
+
+    def is_finished(self):
+        if self.gen_count == 0:
+            return False  # run_ga runs forever
+        last_generation = self.last_generation()
+        # the last saved generation of a complete run
+        return last_generation is not None and last_generation >= self.gen_count - self.gen_count % self.save_nth_gen
+
+    def command(self):
+        player, selection, recombination, mutation = self.config
+        command = [sys.executable, "run_ga.py", "--player", *player, "--selection", *selection,
+                   "--recombination", *recombination, "--mutation", *mutation,
+                   "--gen_count", str(self.gen_count), "--save_nth_gen", str(self.save_nth_gen)]
+        if self.last_generation() is not None:
+            command.append("--cont")
+        return command
+
+    def start(self, log_dir):
+        if os.path.isdir(self.folder_path) and self.last_generation() is None:
+            # a run that died before its first save, which run_ga can neither continue nor start over
+            print("removing {}, it has no saved generation".format(self.folder_path))
+            shutil.rmtree(self.folder_path)
+        self.log_file = open("{}/{}.log".format(log_dir, self.folder_name), "a")
+        self.process = subprocess.Popen(self.command(), stdout=self.log_file, stderr=subprocess.STDOUT)
+
+    def poll(self):
+        return None if self.process is None else self.process.poll()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        self.close()
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+
+def score_summary(scores):
+    return scores.mean(), scores.std() / np.sqrt(len(scores))
+
+
+def find_dominated(runs, opponent_name, min_generation, z):
+    """
+    A run is dominated when, at its latest evaluated generation, another run evaluated at the same generation
+    scores higher by more than z standard errors.
+    """
+    scores = {run.folder_name: load_opponent_scores(run.folder_path, opponent_name) for run in runs}
+    dominated = []
+    for run in runs:
+        run_scores = scores[run.folder_name]
+        if not run_scores:
+            continue
+        generation = max(run_scores)
+        if generation < min_generation:
+            continue
+        mean, se = score_summary(run_scores[generation])
+        for other in runs:
+            other_scores = scores[other.folder_name].get(generation)
+            if other is run or other_scores is None:
+                continue
+            other_mean, other_se = score_summary(other_scores)
+            if other_mean - mean > z * np.sqrt(se ** 2 + other_se ** 2):
+                dominated.append((run, other, generation, mean, other_mean))
+                break
+    return dominated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grid", type=str, required=True)
+    parser.add_argument("--cores", type=int, required=True)
+    parser.add_argument("--opponent_name", type=str, default="random")
+    parser.add_argument("--eval_processes", type=int, default=0,
+                        help="cores of the budget used to run eval_population on the sweep")
+    parser.add_argument("--games_per_chromosome", type=int, default=100)
+    parser.add_argument("--min_generation", type=int, default=20)
+    parser.add_argument("--stop_z", type=float, default=3.)
+    parser.add_argument("--retry_stopped", action="store_const", const=True, default=False)
+    parser.add_argument("--poll_interval", type=float, default=10.)
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    run_slots = args.cores - args.eval_processes
+    assert run_slots > 0, "no cores left for training runs"
+
+    log_dir = os.path.splitext(args.grid)[0] + ".logs"
+    os.makedirs(log_dir, exist_ok=True)
+    state_path = os.path.splitext(args.grid)[0] + ".state.json"
+    stopped = {}
+    if os.path.exists(state_path) and not args.retry_stopped:
+        with open(state_path) as f:
+            stopped = json.load(f)["stopped"]
+
+    runs = [SweepRun(config, grid["gen_count"], grid["save_nth_gen"]) for config in expand_grid(grid)]
+    queue = [run for run in runs if not run.is_finished() and run.folder_name not in stopped]
+    print("{} configurations, {} to run, {} stopped earlier".format(len(runs), len(queue), len(stopped)))
+
+    eval_process = None
+    if args.eval_processes > 0:
+        eval_process = subprocess.Popen([
+            sys.executable, "eval_population.py", "--path", "populations",
+            "--games_per_chromosome", str(args.games_per_chromosome),
+            "--process_count", str(args.eval_processes), "--opponent_name", args.opponent_name,
+        ], stdout=open(log_dir + "/eval_population.log", "a"), stderr=subprocess.STDOUT)
+
+    running = []
+    try:
+        while queue or running:
+            for run in [run for run in running if run.poll() is not None]:
+                print("finished ({}): {}".format(run.poll(), run.folder_name))
+                run.close()
+                running.remove(run)
+
+            for run, other, generation, mean, other_mean in find_dominated(runs, args.opponent_name,
+                                                                          args.min_generation, args.stop_z):
+                if run.folder_name in stopped or run.is_finished():
+                    continue
+                print("stopping {}: {:.3f} < {:.3f} of {} at generation {}".format(
+                    run.folder_name, mean, other_mean, other.folder_name, generation))
+                stopped[run.folder_name] = {"generation": generation, "dominated_by": other.folder_name}
+                run.stop()
+                if run in running:
+                    running.remove(run)
+                if run in queue:
+                    queue.remove(run)
+                with open(state_path, "w") as f:
+                    json.dump({"stopped": stopped}, f, indent=2)
+
+            while queue and len(running) < run_slots:
+                run = queue.pop(0)
+                print("starting: {}".format(" ".join(run.command()[1:])))
+                run.start(log_dir)
+                running.append(run)
+
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for run in running:
+            run.stop()
+        if eval_process is not None:
+            eval_process.terminate()
+            eval_process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import json
+import time
+
+import numpy as np
+
+
+def population_stats(flat_pop, gene_count):
+    # first and second moments of every column in one vectorized pass
+    n = len(flat_pop)
+    moments = np.stack((flat_pop.sum(axis=0), np.einsum('ij,ij->j', flat_pop, flat_pop))) / n
+    mean = moments[0]
+    std = np.sqrt(np.maximum(moments[1] - mean ** 2, 0))
+    return mean[:gene_count], std[:gene_count], mean[gene_count:], std[gene_count:]
+
+
+class TelemetryWriter:
+    def __init__(self, path, gene_count, gene_stats=False, wall_time=0., game_count=None):
+        # wall_time and game_count continue the record of a resumed generation
+        self.path = path
+        self.gene_count = gene_count
+        self.gene_stats = gene_stats
+        self.file = open(path, "a", buffering=1)
+        self.last_time = time.time()
+        self.start_time = self.last_time - wall_time
+        self.last_game_count = game_count
+
+    def write(self, selection):
+        now = time.time()
+        game_count = selection.total_game_count
+        if self.last_game_count is None:
+            self.last_game_count = game_count
+        games = game_count - self.last_game_count
+        interval = now - self.last_time
+        self.last_time = now
+        self.last_game_count = game_count
+
+        flat_pop = selection.get_flat_pop()
+        gene_mean, gene_std, sigma_mean, sigma_std = population_stats(flat_pop, self.gene_count)
+        record = {
+            "generation": selection.current_generation,
+            "time": now,
+            "wall_time": now - self.start_time,
+            "total_game_count": game_count,
+            "games": games,
+            "games_per_sec": games / interval if interval > 0 else 0.,
+            "population_size": len(flat_pop),
+            "gene_mean": float(gene_mean.mean()),
+            "gene_std": float(gene_std.mean()),
+            "gene_abs_max": float(np.abs(gene_mean).max()),
+        }
+        if sigma_mean.size:
+            record["sigma_mean"] = float(sigma_mean.mean())
+            record["sigma_min"] = float(sigma_mean.min())
+            record["sigma_max"] = float(sigma_mean.max())
+        if hasattr(selection.runner, "utilization"):
+            record["worker_utilization"] = selection.runner.utilization()
+        if self.gene_stats:
+            record["genes"] = {
+                "gene_mean": gene_mean.tolist(), "gene_std": gene_std.tolist(),
+                "sigma_mean": sigma_mean.tolist(), "sigma_std": sigma_std.tolist(),
+            }
+        self.file.write(json.dumps(record) + "\n")
+        return record
+
+    def close(self):
+        self.file.close()
+
+
+def read_telemetry(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
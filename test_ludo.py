@@ -0,0 +1,61 @@
+import os
+import sys
+import random
+import subprocess
+
+import pytest
+
+import ludo
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_import_loads_no_heavy_modules():
+    check = "import sys, ludo; print(','.join(m for m in ludo.heavy_modules if m in sys.modules))"
+    imported = subprocess.run([sys.executable, "-c", check], stdout=subprocess.PIPE, check=True, cwd=here,
+                              universal_newlines=True).stdout.strip()
+    assert imported == ""
+
+
+def test_dispatch_overhead():
+    # a command run through the entry point, against running its script directly
+    direct = ludo.measure([sys.executable, os.path.join(here, "distributed.py"), "--help"], 10)
+    dispatched = ludo.measure([sys.executable, os.path.join(here, "ludo.py"), "distributed", "--help"], 10)
+    assert dispatched - direct <= ludo.max_overhead
+
+
+def decisions(count, seed=0):
+    # positions of a game played with random moves, as pyludo hands them to the players
+    pyludo = pytest.importorskip("pyludo")
+    rng = random.Random(seed)
+    state, current_player = pyludo.LudoState(), 0
+    found = []
+    while len(found) < count:
+        if state.get_winner() != -1:
+            state, current_player = pyludo.LudoState(), 0
+        dice_roll = rng.randint(1, 6)
+        relative_state = state.get_state_relative_to_player(current_player)
+        next_states = [relative_state.move_token(token_id, dice_roll) for token_id in range(4)]
+        legal_ids = [token_id for token_id in range(4) if next_states[token_id] is not False]
+        if len(legal_ids) > 1:
+            found.append((relative_state, dice_roll, next_states))
+        if legal_ids:
+            state = next_states[rng.choice(legal_ids)].get_state_relative_to_player((-current_player) % 4)
+        current_player = (current_player + 1) % 4
+    return found
+
+
+def test_players_choose_a_best_move():
+    # the fast decision paths against the generic eval_moves path
+    GAPlayers = pytest.importorskip("GAPlayers")
+    np = pytest.importorskip("numpy")
+    positions = decisions(200)
+    rng = np.random.RandomState(0)
+    for Player in GAPlayers.ga_players:
+        player = Player(rng.randn(Player.gene_count))
+        for state, dice_roll, next_states in positions:
+            token_id = player.play(state, dice_roll, next_states)
+            values = player.eval_moves(player.moves.load(state, dice_roll, next_states))
+            legal_values = [values[i] for i in range(4) if next_states[i] is not False]
+            assert next_states[token_id] is not False
+            assert values[token_id] >= max(legal_values) - 1e-9, Player.name